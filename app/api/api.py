@@ -1,7 +1,11 @@
 from fastapi import APIRouter
 
+from app.api.routers.icons import router as icons
 from app.api.routers.syagent import router as syagent
+from app.api.routers.system import router as system
 
 api_router = APIRouter()
 
 api_router.include_router(syagent)
+api_router.include_router(icons)
+api_router.include_router(system)
@@ -0,0 +1,22 @@
+import hmac
+
+from fastapi import Header, HTTPException, Request
+
+from app.core.config import setting
+from app.services.jobs import JobQueue
+
+
+def get_job_queue(request: Request) -> JobQueue:
+    return request.app.state.job_queue
+
+
+def require_profiling_token(x_profile: str | None = Header(None)) -> None:
+    """
+    X-Profile ヘッダに profiling_token と同じ値を要求する。
+    プロファイルにはリクエストのパスやコードが含まれるため、未設定の場合は常に拒否する。
+    """
+    token = setting.profiling_token
+    if token is None:
+        raise HTTPException(status_code=403, detail="Profiling token is not configured")
+    if x_profile is None or not hmac.compare_digest(x_profile, token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
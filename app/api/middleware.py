@@ -0,0 +1,112 @@
+import hmac
+import random
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import Counter, Histogram
+from app.core.profiler import SamplingProfiler
+
+http_request_time = Histogram(
+    "http_request_duration_seconds",
+    "HTTP リクエストの処理時間（ストリーミングはレスポンスの送信完了まで）",
+    ("method", "route", "status"),
+)
+http_exceptions = Counter(
+    "http_exceptions_total",
+    "ハンドラで捕捉されなかった例外の数",
+    ("method", "route"),
+)
+
+
+class MetricsMiddleware:
+    """
+    ルートごとの HTTP のレイテンシを記録する。
+    ラベルにはパスそのものではなくルートのテンプレートを使い、系列数を抑える。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            http_exceptions.inc(method=scope["method"], route=_route(scope))
+            raise
+        finally:
+            http_request_time.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=_route(scope),
+                status=str(status),
+            )
+
+
+class ProfilingMiddleware:
+    """
+    X-Profile ヘッダでトークンが指定されたリクエストと、sample_rate の割合で選んだ
+    リクエストをプロファイルする。
+    ストリーミングのレスポンスも送信完了まで含め、保存したプロファイルの ID を
+    X-Profile-Id ヘッダで返す。
+    対象外のリクエストではヘッダの確認と乱数の生成しか行わない。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        profiler: SamplingProfiler,
+        token: str | None = None,
+        sample_rate: float = 0.0,
+    ):
+        self.app = app
+        self.profiler = profiler
+        self.token = token
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        with self.profiler.profile(scope["method"], scope["path"]) as profile:
+
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    profile.status = message["status"]
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-Profile-Id", profile.id)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profile.route = _route(scope)
+
+    def _should_profile(self, scope: Scope) -> bool:
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == b"x-profile" and hmac.compare_digest(
+                    value, self.token.encode()
+                ):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+
+def _route(scope: Scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
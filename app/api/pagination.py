@@ -0,0 +1,15 @@
+from fastapi import Response
+
+from app.crud.pagination import Page
+
+
+def set_page_headers(response: Response, page: Page) -> None:
+    """
+    次のページを取得するためのカーソルをレスポンスヘッダに設定する。
+    レスポンスボディは従来通りリストのままにして、既存のクライアントと互換を保つ。
+    """
+    if page.before is not None:
+        response.headers["X-Before-Cursor"] = page.before
+    if page.after is not None:
+        response.headers["X-After-Cursor"] = page.after
+    response.headers["X-Has-More"] = "true" if page.has_more else "false"
@@ -0,0 +1,71 @@
+import re
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, Response
+
+from app.services.storage import BlobStore, get_icon_store
+
+router = APIRouter(prefix="/icons", tags=["icons"])
+
+# アイコンは内容のハッシュ値で参照されるため、同じURLの内容は変わらない
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+@router.get("/{icon_hash}")
+async def get_icon(
+    request: Request,
+    icon_hash: str = Path(..., pattern=r"^[0-9a-f]{64}$"),
+    store: BlobStore = Depends(get_icon_store),
+) -> Response:
+    etag = f'"{icon_hash}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if_none_match = _parse_etags(request.headers.get("if-none-match"))
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    data = await store.get(icon_hash)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Icon not found")
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = _parse_range(range_header, len(data))
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{len(data)}"
+            return Response(status_code=416, headers=headers)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        return Response(
+            content=data[start : end + 1],
+            status_code=206,
+            media_type="image/png",
+            headers=headers,
+        )
+    return Response(content=data, media_type="image/png", headers=headers)
+
+
+def _parse_etags(header: str | None) -> list[str]:
+    if not header:
+        return []
+    return [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    単一範囲の Range ヘッダを解釈し、(開始, 終了) を返す。
+    満たせない範囲の場合は None を返す。
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # bytes=-N は末尾 N バイト
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
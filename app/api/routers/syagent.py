@@ -1,11 +1,38 @@
-from fastapi import APIRouter, Depends
+import asyncio
+from contextlib import aclosing
+from functools import partial
+from uuid import uuid4
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.deps import get_job_queue
+from app.api.pagination import set_page_headers
+from app.api.sse import format_sse, track_stream
+from app.core.config import setting
 from app.crud import syagent as syagent_crud
-from app.db.session import get_db
+from app.db.session import get_db, get_read_db
 from app.schemas import syagent as syagent_schema
 from app.schemas import utils as utils_schema
+from app.services.jobs import JobQueue
+from app.services.streams import (
+    StreamNotFound,
+    StreamOffsetExpired,
+    StreamStore,
+    get_stream_store,
+    start_stream,
+    stream_resumes,
+)
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
@@ -13,9 +40,18 @@ router = APIRouter(prefix="/agents", tags=["agents"])
 # /agents/{user_id} に対するエンドポイントを定義
 @router.get("/{user_id}", response_model=list[syagent_schema.OutputConversation])
 async def get_conversations(
-    user_id: str, db: AsyncSession = Depends(get_db)
+    user_id: str,
+    response: Response,
+    limit: int = Query(setting.page_default_limit, ge=1, le=setting.page_max_limit),
+    before: str | None = Query(None, description="このカーソルより古い会話を取得する"),
+    after: str | None = Query(None, description="このカーソルより新しい会話を取得する"),
+    db: AsyncSession = Depends(get_read_db),
 ) -> list[syagent_schema.OutputConversation]:
-    return await syagent_crud.read_conversations(db, user_id)
+    page = await syagent_crud.read_conversations(
+        db, user_id, limit, before=before, after=after
+    )
+    set_page_headers(response, page)
+    return page.items
 
 
 @router.post("/{user_id}", response_model=syagent_schema.OutputConversation)
@@ -27,32 +63,185 @@ async def post_conversation(
     return await syagent_crud.create_conversation(db, user_id, current_profile)
 
 
+# /agents/{user_id}/jobs に対するエンドポイントを定義
+@router.post(
+    "/{user_id}/jobs",
+    response_model=syagent_schema.OutputJob,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def post_conversation_job(
+    user_id: str,
+    current_profile: syagent_schema.CurrentProfile,
+    db: AsyncSession = Depends(get_db),
+    job_queue: JobQueue = Depends(get_job_queue),
+) -> syagent_schema.OutputJob:
+    job = await syagent_crud.create_conversation_job(db, user_id, current_profile)
+    # ワーカーからジョブを参照できるよう、キューに積む前に commit する
+    await db.commit()
+    await job_queue.enqueue(job.id)
+    return job
+
+
+# /agents/jobs/{job_id} に対するエンドポイントを定義
+@router.get("/jobs/{job_id}", response_model=syagent_schema.OutputJob)
+async def get_job(
+    job_id: int, db: AsyncSession = Depends(get_db)
+) -> syagent_schema.OutputJob:
+    return await syagent_crud.read_job(db, job_id)
+
+
+@router.get("/jobs/{job_id}/events")
+async def get_job_events(
+    job_id: int, request: Request, db: AsyncSession = Depends(get_db)
+) -> StreamingResponse:
+    job = await syagent_crud.read_job(db, job_id)
+
+    async def stream_job():
+        last = None
+        current = job
+        while True:
+            if (current.status, current.stage) != last:
+                last = (current.status, current.stage)
+                if current.status in ("succeeded", "failed"):
+                    yield format_sse("end", current)
+                    return
+                yield format_sse("progress", current)
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(setting.conversation_job_poll_interval)
+            async with request.app.state.db_session() as session:
+                current = await syagent_crud.read_job(session, job_id)
+
+    return StreamingResponse(
+        track_stream("job_events", stream_job()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # /agents/conversations/{conversation_id} に対するエンドポイントを定義
 @router.get(
     "/conversations/{conversation_id}",
     response_model=list[syagent_schema.OutputMessage],
 )
-async def get_messages(conversation_id: int, db: AsyncSession = Depends(get_db)):
-    return await syagent_crud.read_messages(db, conversation_id)
+async def get_messages(
+    conversation_id: int,
+    response: Response,
+    limit: int = Query(setting.page_default_limit, ge=1, le=setting.page_max_limit),
+    before: str | None = Query(
+        None, description="このカーソルより古いメッセージを取得する"
+    ),
+    after: str | None = Query(
+        None, description="このカーソルより新しいメッセージを取得する"
+    ),
+    since: int | None = Query(
+        None, description="このIDのメッセージより新しいメッセージのみを取得する"
+    ),
+    db: AsyncSession = Depends(get_read_db),
+) -> list[syagent_schema.OutputMessage]:
+    page = await syagent_crud.read_messages(
+        db, conversation_id, limit, before=before, after=after, since=since
+    )
+    set_page_headers(response, page)
+    return page.items
 
 
-@router.post(
-    "/conversations/{conversation_id}", response_model=syagent_schema.OutputMessage
-)
+@router.post("/conversations/{conversation_id}")
 async def post_message(
     conversation_id: int,
     input_message: syagent_schema.InputMessage,
+    request: Request,
     db: AsyncSession = Depends(get_db),
 ) -> StreamingResponse:
-    output_message = await syagent_crud.create_message(
-        db, conversation_id, input_message
+    """
+    応答をストリーミングする。応答の生成は接続とは独立に続き、切断した場合は
+    X-Stream-Id ヘッダのストリームを GET .../streams/{stream_id} で続きから読める。
+    """
+    events = await syagent_crud.create_message(
+        db, request.app.state.db_session, conversation_id, input_message
     )
 
+    async def serialize_events():
+        async with aclosing(events):
+            async for event in events:
+                if isinstance(event, syagent_schema.StreamChunk):
+                    yield "chunk", event.model_dump_json()
+                else:
+                    yield "end", event.model_dump_json()
+
+    stream_id = uuid4().hex
+    store = get_stream_store()
+    await start_stream(
+        store,
+        _stream_key(conversation_id, stream_id),
+        serialize_events(),
+        abandon_after=setting.chat_stream_abandon_seconds,
+        # 応答の保存後に、溜まった古い履歴を要約に畳み込む
+        on_complete=partial(
+            syagent_crud.update_conversation_summary,
+            request.app.state.db_session,
+            conversation_id,
+        ),
+    )
+    return await _stream_response(store, conversation_id, stream_id, offset=0)
+
+
+@router.get("/conversations/{conversation_id}/streams/{stream_id}")
+async def get_message_stream(
+    conversation_id: int,
+    stream_id: str,
+    offset: int | None = Query(
+        None,
+        ge=0,
+        description="このイベント（最後に受け取ったイベントの id + 1）から読み直す",
+    ),
+    last_event_id: int | None = Header(None, alias="Last-Event-ID"),
+) -> StreamingResponse:
+    """
+    応答のストリームを途中から読み直す。
+    offset を省略した場合は、EventSource が再接続時に送る Last-Event-ID の次から読む。
+    """
+    if offset is None:
+        offset = last_event_id + 1 if last_event_id is not None else 0
+    response = await _stream_response(
+        get_stream_store(), conversation_id, stream_id, offset
+    )
+    stream_resumes.inc()
+    return response
+
+
+def _stream_key(conversation_id: int, stream_id: str) -> str:
+    return f"chat:{conversation_id}:{stream_id}"
+
+
+async def _stream_response(
+    store: StreamStore, conversation_id: int, stream_id: str, offset: int
+) -> StreamingResponse:
+    try:
+        events = await store.open(_stream_key(conversation_id, stream_id), offset)
+    except StreamNotFound:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    except StreamOffsetExpired:
+        # 押し出されたイベントは返せないため、保存済みのメッセージを取得させる
+        raise HTTPException(status_code=410, detail="Stream offset expired")
+
     async def stream_messages():
-        for message in output_message:
-            yield message
+        try:
+            async for event in events:
+                yield format_sse(event.event, event.data, id=str(event.offset))
+        except StreamOffsetExpired:
+            # 送信が追いつかなかった。クライアントは再接続して 410 を受け取る
+            return
 
-    return StreamingResponse(stream_messages(), media_type="text/event-stream")
+    return StreamingResponse(
+        track_stream("chat", stream_messages()),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Stream-Id": stream_id,
+        },
+    )
 
 
 @router.delete(
@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from app.api.deps import require_profiling_token
+from app.core.cache import caches
+from app.core.profiler import profiler
+from app.schemas import system as system_schema
+
+router = APIRouter(prefix="/system", tags=["system"])
+
+
+@router.get("/ready", response_model=system_schema.Readiness)
+async def get_ready(request: Request) -> system_schema.Readiness:
+    """
+    起動時の準備（モデルのクライアントの生成と DB への接続）が終わるまでは 503 を返す。
+    ロードバランサの readiness probe に使う。
+    """
+    readiness = request.app.state.readiness
+    if not readiness.ready:
+        raise HTTPException(status_code=503, detail="Warming up")
+    return readiness
+
+
+@router.get("/caches", response_model=list[system_schema.CacheStats])
+async def get_caches() -> list[system_schema.CacheStats]:
+    return [system_schema.CacheStats.model_validate(cache.stats()) for cache in caches]
+
+
+@router.get("/db-pools", response_model=list[system_schema.PoolStats])
+async def get_db_pools(request: Request) -> list[system_schema.PoolStats]:
+    return [
+        system_schema.PoolStats.model_validate(metrics.stats(name, engine.pool))
+        for name, (engine, metrics) in request.app.state.db_pools.items()
+    ]
+
+
+@router.get(
+    "/profiles",
+    response_model=list[system_schema.ProfileSummary],
+    dependencies=[Depends(require_profiling_token)],
+)
+async def get_profiles() -> list[system_schema.ProfileSummary]:
+    return [
+        system_schema.ProfileSummary.model_validate(profile)
+        for profile in profiler.recent()
+    ]
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(require_profiling_token)],
+)
+async def get_profile(profile_id: str) -> PlainTextResponse:
+    """
+    プロファイルを folded 形式で返す（flamegraph.pl や speedscope で読み込める）。
+    """
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile.folded())
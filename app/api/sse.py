@@ -0,0 +1,42 @@
+from typing import AsyncIterator
+
+from pydantic import BaseModel
+
+from app.core.metrics import Counter, Gauge
+
+streams_in_flight = Gauge(
+    "sse_streams_in_flight", "送信中の Server-Sent Events のストリーム数", ("stream",)
+)
+stream_errors = Counter(
+    "sse_stream_errors_total",
+    "例外により中断した Server-Sent Events のストリーム数",
+    ("stream",),
+)
+
+
+def format_sse(event: str, data: BaseModel | str, id: str | None = None) -> str:
+    """
+    Server-Sent Events の1イベント分の文字列を組み立てる。
+    data が文字列の場合は、シリアライズ済みの JSON としてそのまま使う。
+    """
+    lines = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    lines.append(f"event: {event}")
+    if isinstance(data, BaseModel):
+        data = data.model_dump_json()
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def track_stream(stream: str, events: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    ストリームの送信中の数と、例外で中断した数を記録する。
+    """
+    with streams_in_flight.track_inprogress(stream=stream):
+        try:
+            async for event in events:
+                yield event
+        except Exception:
+            stream_errors.inc(stream=stream)
+            raise
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# 名前 -> 名前を付けて生成された Lazy。起動時に warm_up でまとめて生成する
+registry: dict[str, "Lazy[Any]"] = {}
+
+
+class Lazy(Generic[T]):
+    """
+    最初に使われた時に一度だけ生成するオブジェクト。
+    外部サービスのクライアントを import 時に生成しないために使う。
+    ベンチマークなどでは、最初に使われる前に override で差し替えられる。
+    name を指定すると registry に登録し、起動時の warm_up の対象にする。
+    """
+
+    def __init__(self, factory: Callable[[], T], name: str | None = None):
+        self._factory = factory
+        self._value: T | None = None
+        # スレッドプールから使われる場合もあるため、二重に生成しないようにする
+        self._lock = threading.Lock()
+        if name is not None:
+            registry[name] = self
+
+    def get(self) -> T:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+        return self._value
+
+    def override(self, value: T) -> None:
+        with self._lock:
+            self._value = value
+
+    @property
+    def initialized(self) -> bool:
+        return self._value is not None
+
+
+async def warm_up() -> dict[str, bool]:
+    """
+    registry の Lazy を並行して生成し、名前ごとに成功したかどうかを返す。
+    クライアントの生成は認証情報の取得などでブロックするため、スレッドプールで行う。
+    失敗したものは、最初に使われた時に改めて生成を試みる。
+    """
+
+    async def create(name: str, lazy: Lazy[Any]) -> bool:
+        try:
+            await asyncio.to_thread(lazy.get)
+        except Exception:
+            logger.exception("failed to warm up %s", name)
+            return False
+        return True
+
+    names = list(registry)
+    results = await asyncio.gather(*(create(name, registry[name]) for name in names))
+    return dict(zip(names, results))
@@ -0,0 +1,221 @@
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from types import CodeType, FrameType
+from typing import Any, Iterator
+
+from app.core.config import setting
+
+# 実行中のタスクがどのプロファイルに属するかを判定するための変数。
+# 子タスクにもコンテキストがコピーされるため、リクエスト内で作られたタスクも対象になる
+_active_profile: ContextVar["Profile | None"] = ContextVar(
+    "active_profile", default=None
+)
+
+# イベントループがタスクを実行するフレーム。ここより外側のフレームは集計から除く
+_HANDLE_RUN_CODE = asyncio.events.Handle._run.__code__
+
+# 中断中のタスクのスタックの末尾に付けるフレーム
+AWAIT_FRAME = "<await>"
+
+
+@dataclass(eq=False)
+class Profile:
+    id: str
+    method: str
+    path: str
+    started_at: datetime
+    route: str = "unmatched"
+    status: int | None = None
+    duration_seconds: float | None = None
+    samples: int = 0
+    stacks: Counter[str] = field(default_factory=Counter)
+    _loop: asyncio.AbstractEventLoop | None = field(default=None, repr=False)
+    _thread_id: int | None = field(default=None, repr=False)
+    # リクエストを処理しているタスクと、最後に実行されていたタスク。
+    # 中断中は最後のタスク（終了していればリクエストのタスク）の await の連鎖を辿る
+    _root_task: asyncio.Task | None = field(default=None, repr=False)
+    _last_task: asyncio.Task | None = field(default=None, repr=False)
+
+    def folded(self) -> str:
+        """
+        flamegraph.pl や speedscope で読み込める folded 形式で返す。
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+class SamplingProfiler:
+    """
+    イベントループのスレッドを一定間隔でサンプリングし、プロファイル中のリクエストの
+    スタックを集計する。
+    実行中であればそのスタックを、ネットワーク待ちなどで中断していれば await の連鎖を
+    記録するため、CPU 時間ではなく経過時間の内訳になる。
+    サンプリング用のスレッドはプロファイル中のリクエストがある間だけ動かす。
+    """
+
+    def __init__(self, interval: float, max_profiles: int):
+        self.interval = interval
+        self._profiles: deque[Profile] = deque(maxlen=max_profiles)
+        self._active: set[Profile] = set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @contextmanager
+    def profile(self, method: str, path: str) -> Iterator[Profile]:
+        """
+        ブロック内（とそこから作られたタスク）の実行をプロファイルする。
+        イベントループ上から呼び出す。
+        """
+        profile = Profile(
+            id=uuid.uuid4().hex,
+            method=method,
+            path=path,
+            started_at=datetime.now(timezone.utc),
+            _loop=asyncio.get_running_loop(),
+            _thread_id=threading.get_ident(),
+            _root_task=asyncio.current_task(),
+        )
+        token = _active_profile.set(profile)
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="sampling-profiler", daemon=True
+                )
+                self._thread.start()
+        start = time.perf_counter()
+        try:
+            yield profile
+        finally:
+            _active_profile.reset(token)
+            with self._lock:
+                profile.duration_seconds = time.perf_counter() - start
+                profile._root_task = profile._last_task = None
+                self._active.discard(profile)
+                self._profiles.append(profile)
+
+    def get(self, profile_id: str) -> Profile | None:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+    def recent(self) -> list[Profile]:
+        """
+        保持しているプロファイルを新しい順に返す。
+        """
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                self._sample()
+            time.sleep(self.interval)
+
+    def _sample(self) -> None:
+        frames = sys._current_frames()
+        running: dict[asyncio.AbstractEventLoop, tuple[Any, Profile | None]] = {}
+        for profile in self._active:
+            loop = profile._loop
+            if loop is None:
+                continue
+            if loop not in running:
+                task = asyncio.current_task(loop)
+                owner = task.get_context().get(_active_profile) if task else None
+                running[loop] = (task, owner)
+            task, owner = running[loop]
+            frame = frames.get(profile._thread_id or 0)
+            if owner is profile and frame is not None:
+                stack = _thread_stack(frame)
+                profile._last_task = task
+            else:
+                task = profile._last_task
+                if task is None or task.done():
+                    task = profile._root_task
+                stack = _await_stack(task)
+                stack.append(AWAIT_FRAME)
+            profile.stacks[";".join(stack)] += 1
+            profile.samples += 1
+
+
+def _thread_stack(frame: FrameType | None) -> list[str]:
+    """
+    実行中のフレームからタスクの先頭までのスタックを外側から順に返す。
+    """
+    stack = []
+    while frame is not None and frame.f_code is not _HANDLE_RUN_CODE:
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_stack(task: asyncio.Task | None) -> list[str]:
+    """
+    中断中のタスクが await しているコルーチンの連鎖を外側から順に返す。
+    """
+    stack: list[str] = []
+    if task is None or task.done():
+        return stack
+    awaitable: Any = task.get_coro()
+    while awaitable is not None:
+        frame = _awaitable_frame(awaitable)
+        if frame is None:
+            # async for が await する asend オブジェクトは元の非同期ジェネレータを
+            # 属性として公開していないため、参照先から辿る
+            if type(awaitable).__name__ != "async_generator_asend":
+                break
+            awaitable = next(
+                (r for r in gc.get_referents(awaitable) if hasattr(r, "ag_frame")),
+                None,
+            )
+            continue
+        stack.append(_label(frame.f_code))
+        awaitable = (
+            getattr(awaitable, "cr_await", None)
+            or getattr(awaitable, "ag_await", None)
+            or getattr(awaitable, "gi_yieldfrom", None)
+        )
+    return stack
+
+
+def _awaitable_frame(awaitable: Any) -> FrameType | None:
+    for attr in ("cr_frame", "ag_frame", "gi_frame"):
+        frame = getattr(awaitable, attr, None)
+        if frame is not None:
+            return frame
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _label(code: CodeType) -> str:
+    filename = _short_filename(code.co_filename)
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+
+
+@lru_cache(maxsize=1024)
+def _short_filename(filename: str) -> str:
+    # sys.path からの相対パスにして、環境ごとのパスの違いを吸収する
+    for prefix in sorted(filter(None, sys.path), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1 :]
+    return filename
+
+
+profiler = SamplingProfiler(
+    setting.profiling_interval_seconds, setting.profiling_max_profiles
+)
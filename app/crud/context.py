@@ -0,0 +1,271 @@
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+from sqlalchemy import ScalarSelect, Select, func, literal_column, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.cache import TTLCache
+from app.core.config import setting
+from app.models import syagent as syagent_model
+from app.schemas import syagent as syagent_schema
+from app.services.syagent.history import fit_to_budget
+
+
+@dataclass(frozen=True)
+class ConversationProfiles:
+    """会話作成後は変更されないプロフィール情報と、その描画結果"""
+
+    current_prof: syagent_schema.CurrentProfile
+    future_prof: syagent_schema.FutureProfile
+    current_prof_text: str
+    future_prof_text: str
+
+
+# conversation_id -> プロフィール情報
+profiles_cache: TTLCache[int, ConversationProfiles] = TTLCache(
+    "conversation_profiles",
+    maxsize=setting.context_cache_size,
+    ttl=setting.context_cache_ttl_seconds,
+)
+
+
+def invalidate_conversation_context(conversation_id: int) -> None:
+    profiles_cache.invalidate(conversation_id)
+
+
+async def load_conversation_context(
+    db: AsyncSession, conversation_id: int
+) -> syagent_schema.ConversationContext:
+    """
+    チャットに必要な会話の情報を取得する。
+    プロフィールがキャッシュにあれば会話の存在確認と要約・履歴のみを1回のクエリで取得し、
+    なければ会話と2つのプロフィールを1回目で、スキル・目標・要約・履歴を2回目で取得する。
+    履歴は要約に取り込まれていない直近のメッセージのみを、トークン数の上限内で返す。
+    """
+    profiles = profiles_cache.get(conversation_id)
+    if profiles is not None:
+        history_result = await db.execute(_history_statement(conversation_id))
+        exists = False
+        summary = ""
+        history: list[syagent_schema.RoleMessage] = []
+        for kind, value in history_result.tuples():
+            if kind == "conversation":
+                exists = True
+            elif kind == "summary":
+                summary = value
+            elif kind == "user" or kind == "agent":
+                history.append(syagent_schema.RoleMessage(role=kind, content=value))
+        if not exists:
+            # 他のプロセスで削除された会話のキャッシュが残っていた
+            profiles_cache.invalidate(conversation_id)
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return _build_context(conversation_id, profiles, summary, history)
+
+    profiles_result = await db.execute(
+        select(
+            syagent_model.Conversation,
+            syagent_model.FutureProfile,
+            syagent_model.CurrentProfile,
+        )
+        .join(
+            syagent_model.FutureProfile,
+            syagent_model.Conversation.future_profile_id
+            == syagent_model.FutureProfile.id,
+        )
+        .join(
+            syagent_model.CurrentProfile,
+            syagent_model.FutureProfile.current_profile_id
+            == syagent_model.CurrentProfile.id,
+        )
+        .where(syagent_model.Conversation.id == conversation_id)
+    )
+    row = profiles_result.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    _, future_profile, current_profile = row
+
+    items_result = await db.execute(_context_items_statement(conversation_id))
+    items: dict[str, list[str]] = {
+        "current_skill": [],
+        "future_goal": [],
+        "future_skill": [],
+    }
+    summary = ""
+    history = []
+    for kind, value in items_result.tuples():
+        if kind == "user" or kind == "agent":
+            history.append(syagent_schema.RoleMessage(role=kind, content=value))
+        elif kind == "summary":
+            summary = value
+        else:
+            items[kind].append(value)
+
+    current_prof = syagent_schema.CurrentProfile(
+        age=current_profile.age,
+        status=current_profile.status,
+        skills=items["current_skill"],
+        values=current_profile.values,
+        restrictions=current_profile.restrictions,
+        future_goals=items["future_goal"],
+        extra=current_profile.extra,
+    )
+    future_prof = syagent_schema.FutureProfile(
+        status=future_profile.status,
+        time_frame=future_profile.time_frame,
+        skills=items["future_skill"],
+        summary=future_profile.summary,
+    )
+    profiles = ConversationProfiles(
+        current_prof=current_prof,
+        future_prof=future_prof,
+        current_prof_text=current_prof.to_str(),
+        future_prof_text=future_prof.to_str(),
+    )
+    profiles_cache.set(conversation_id, profiles)
+    return _build_context(conversation_id, profiles, summary, history)
+
+
+async def prime_statements(db: AsyncSession) -> None:
+    """
+    load_conversation_context のクエリを、存在しない会話で実行しておく。
+    プロフィールがキャッシュにない場合とある場合の両方のクエリを実行する。
+    """
+    try:
+        await load_conversation_context(db, 0)
+    except HTTPException:
+        pass
+    await db.execute(_history_statement(0))
+
+
+def _build_context(
+    conversation_id: int,
+    profiles: ConversationProfiles,
+    summary: str,
+    history: list[syagent_schema.RoleMessage],
+) -> syagent_schema.ConversationContext:
+    return syagent_schema.ConversationContext(
+        conversation_id=conversation_id,
+        current_prof=profiles.current_prof,
+        future_prof=profiles.future_prof,
+        current_prof_text=profiles.current_prof_text,
+        future_prof_text=profiles.future_prof_text,
+        summary=summary,
+        history=fit_to_budget(history, setting.chat_history_token_budget),
+    )
+
+
+def summarized_until_id(conversation_id: int) -> ScalarSelect[int]:
+    """
+    要約に取り込み済みの最後のメッセージID（要約がなければ 0）を返すサブクエリ。
+    """
+    return select(
+        func.coalesce(
+            select(syagent_model.ConversationSummary.summarized_until_id)
+            .filter_by(conversation_id=conversation_id)
+            .scalar_subquery(),
+            0,
+        )
+    ).scalar_subquery()
+
+
+def _history_selects(
+    conversation_id: int,
+) -> tuple[Select[tuple[str, str, int]], Select[tuple[str, str, int]]]:
+    """
+    要約と、まだ要約に取り込んでいない直近のメッセージを (種類, 値, ID) で返す。
+    要約の ID は 0 とし、メッセージより前に並ぶようにする。
+    """
+    summary = select(
+        literal_column("'summary'").label("kind"),
+        syagent_model.ConversationSummary.summary.label("value"),
+        literal_column("0").label("id"),
+    ).where(syagent_model.ConversationSummary.conversation_id == conversation_id)
+    recent = (
+        select(
+            syagent_model.Message.role.label("kind"),
+            syagent_model.Message.message.label("value"),
+            syagent_model.Message.id.label("id"),
+        )
+        .where(
+            syagent_model.Message.conversation_id == conversation_id,
+            syagent_model.Message.id > summarized_until_id(conversation_id),
+        )
+        .order_by(syagent_model.Message.id.desc())
+        .limit(
+            setting.chat_history_window_messages + setting.chat_summary_batch_messages
+        )
+        .subquery()
+    )
+    return summary, select(recent.c.kind, recent.c.value, recent.c.id)
+
+
+def _history_statement(conversation_id: int) -> Select[tuple[str, str]]:
+    """
+    要約と履歴に、会話が存在すれば種類 'conversation' の行を先頭に加えて返す。
+    キャッシュは各プロセスにあるため、他のプロセスでの削除はこの行の有無で検出する。
+    """
+    conversation = select(
+        literal_column("'conversation'").label("kind"),
+        literal_column("''").label("value"),
+        literal_column("-1").label("id"),
+    ).where(syagent_model.Conversation.id == conversation_id)
+    history = union_all(conversation, *_history_selects(conversation_id)).subquery()
+    return select(history.c.kind, history.c.value).order_by(history.c.id)
+
+
+def _context_items_statement(conversation_id: int) -> Select[tuple[str, str]]:
+    """
+    会話に紐づくスキル・目標・メッセージを (種類, 値) の行として1つのクエリにまとめる。
+    メッセージの種類はロール（user / agent）になる。
+    """
+    conversation = syagent_model.Conversation
+    future_profile = syagent_model.FutureProfile
+    current_skills = (
+        select(
+            literal_column("'current_skill'").label("kind"),
+            syagent_model.CurrentSkill.skill.label("value"),
+            syagent_model.CurrentSkill.id.label("id"),
+        )
+        .join(
+            future_profile,
+            future_profile.current_profile_id
+            == syagent_model.CurrentSkill.current_profile_id,
+        )
+        .join(conversation, conversation.future_profile_id == future_profile.id)
+        .where(conversation.id == conversation_id)
+    )
+    future_goals = (
+        select(
+            literal_column("'future_goal'").label("kind"),
+            syagent_model.FutureGoal.goal.label("value"),
+            syagent_model.FutureGoal.id.label("id"),
+        )
+        .join(
+            future_profile,
+            future_profile.current_profile_id
+            == syagent_model.FutureGoal.current_profile_id,
+        )
+        .join(conversation, conversation.future_profile_id == future_profile.id)
+        .where(conversation.id == conversation_id)
+    )
+    future_skills = (
+        select(
+            literal_column("'future_skill'").label("kind"),
+            syagent_model.FutureSkill.skill.label("value"),
+            syagent_model.FutureSkill.id.label("id"),
+        )
+        .join(
+            conversation,
+            conversation.future_profile_id
+            == syagent_model.FutureSkill.future_profile_id,
+        )
+        .where(conversation.id == conversation_id)
+    )
+    items = union_all(
+        current_skills,
+        future_goals,
+        future_skills,
+        *_history_selects(conversation_id),
+    ).subquery()
+    return select(items.c.kind, items.c.value).order_by(items.c.id)
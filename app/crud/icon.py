@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from app.core.cache import TTLCache
+from app.core.config import setting
+from app.core.metrics import Counter
+from app.models import syagent as syagent_model
+from app.services.storage import get_icon_store
+from app.services.syagent.image import (
+    PROMPT_VERSION,
+    agenerate_icon,
+    normalize_summary,
+    placeholder_icon,
+)
+
+logger = logging.getLogger(__name__)
+
+# (正規化済みの要約, プロンプトのバージョン) -> アイコンのハッシュ値のリスト
+icon_cache: TTLCache[tuple[str, str], list[str]] = TTLCache(
+    "icons", maxsize=setting.icon_cache_size, ttl=setting.icon_cache_ttl_seconds
+)
+_filling: set[tuple[str, str]] = set()
+_background_tasks: set[asyncio.Task] = set()
+_placeholder_hash: str | None = None
+
+placeholders_served = Counter(
+    "icon_placeholders_total", "Imagen を利用できずに代替のアイコンを返した回数"
+)
+
+
+async def get_icon_hash(
+    session_factory: async_sessionmaker[AsyncSession], summary: str
+) -> str:
+    """
+    要約に対応するアイコンのハッシュ値を取得する。
+    プロセス内キャッシュ、DB の順に探し、どちらにもない場合のみ Imagen で生成する。
+    呼び出し元のトランザクションとは独立した短いセッションを使うため、
+    Imagen の呼び出し中にトランザクションを開いたままにしない。
+    Imagen で生成できなかった場合は、会話の作成を失敗させずに代替のアイコンを返す。
+    代替のアイコンはキャッシュせず、次の呼び出しで改めて生成を試みる。
+    """
+    key = (normalize_summary(summary), PROMPT_VERSION)
+    pool = icon_cache.get(key)
+    if pool is None:
+        async with session_factory() as db:
+            pool = await _read_pool(db, key)
+            await db.commit()
+        if pool:
+            icon_cache.set(key, pool)
+    if not pool:
+        try:
+            image = await agenerate_icon(summary)
+        except Exception:
+            logger.warning("failed to generate icon, using placeholder", exc_info=True)
+            placeholders_served.inc()
+            return await get_placeholder_icon_hash()
+        async with session_factory() as db:
+            icon_hash = await _add_variant(db, key, image, variant=0)
+            await db.commit()
+        pool = [icon_hash]
+        icon_cache.set(key, pool)
+    # プールが埋まっていなければ、残りのバリエーションはバックグラウンドで生成する
+    if len(pool) < setting.icon_variant_pool_size:
+        _schedule_fill(session_factory, summary)
+    return random.choice(pool)
+
+
+async def fill_icon_pool(
+    session_factory: async_sessionmaker[AsyncSession], summary: str
+) -> None:
+    """
+    要約に対応するアイコンを icon_variant_pool_size 個まで生成して保存する。
+    """
+    key = (normalize_summary(summary), PROMPT_VERSION)
+    async with session_factory() as db:
+        variants = await _read_variants(db, key)
+        await db.commit()
+        # 失効したバリエーションは番号が飛ぶため、欠けている番号を埋める
+        for variant in range(setting.icon_variant_pool_size):
+            if variant in variants:
+                continue
+            image = await agenerate_icon(summary)
+            variants[variant] = await _add_variant(db, key, image, variant=variant)
+            await db.commit()
+    icon_cache.set(key, [variants[variant] for variant in sorted(variants)])
+
+
+async def get_placeholder_icon_hash() -> str:
+    global _placeholder_hash
+    if _placeholder_hash is None:
+        _placeholder_hash = await get_icon_store().put(placeholder_icon())
+    return _placeholder_hash
+
+
+async def prewarm_icon_pools(
+    session_factory: async_sessionmaker[AsyncSession], summaries: list[str]
+) -> None:
+    for summary in summaries:
+        try:
+            await fill_icon_pool(session_factory, summary)
+        except Exception:
+            logger.exception("failed to prewarm icons for %s", summary)
+
+
+async def prime_statements(db: AsyncSession) -> None:
+    await _read_pool(db, ("", PROMPT_VERSION))
+
+
+async def _read_pool(db: AsyncSession, key: tuple[str, str]) -> list[str]:
+    return list((await _read_variants(db, key)).values())
+
+
+async def _read_variants(db: AsyncSession, key: tuple[str, str]) -> dict[int, str]:
+    """
+    失効していないバリエーションの番号と、アイコンのハッシュ値の組を返す。
+    """
+    summary_key, prompt_version = key
+    cutoff = datetime.now(ZoneInfo("Asia/Tokyo")) - timedelta(
+        seconds=setting.icon_cache_db_ttl_seconds
+    )
+    result = await db.execute(
+        select(
+            syagent_model.IconCacheEntry.variant,
+            syagent_model.IconCacheEntry.icon_hash,
+        )
+        .filter_by(summary_key=summary_key, prompt_version=prompt_version)
+        .where(syagent_model.IconCacheEntry.created_at >= cutoff)
+        .order_by(syagent_model.IconCacheEntry.variant)
+    )
+    return dict(result.tuples().all())
+
+
+async def _add_variant(
+    db: AsyncSession, key: tuple[str, str], image: bytes, variant: int
+) -> str:
+    summary_key, prompt_version = key
+    icon_hash = await get_icon_store().put(image)
+    try:
+        async with db.begin_nested():
+            # 失効したエントリが残っている場合は置き換える
+            await db.execute(
+                delete(syagent_model.IconCacheEntry).filter_by(
+                    summary_key=summary_key,
+                    prompt_version=prompt_version,
+                    variant=variant,
+                )
+            )
+            db.add(
+                syagent_model.IconCacheEntry(
+                    summary_key=summary_key,
+                    prompt_version=prompt_version,
+                    variant=variant,
+                    icon_hash=icon_hash,
+                )
+            )
+    except IntegrityError:
+        # 他のワーカーが同じバリエーションを先に登録した
+        pass
+    return icon_hash
+
+
+def _schedule_fill(
+    session_factory: async_sessionmaker[AsyncSession], summary: str
+) -> None:
+    key = (normalize_summary(summary), PROMPT_VERSION)
+    if key in _filling:
+        return
+    _filling.add(key)
+
+    async def fill() -> None:
+        try:
+            await fill_icon_pool(session_factory, summary)
+        except Exception:
+            logger.exception("failed to fill icon pool for %s", summary)
+        finally:
+            _filling.discard(key)
+
+    task = asyncio.create_task(fill())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
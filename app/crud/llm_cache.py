@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from app.core.config import setting
+from app.models import syagent as syagent_model
+from app.services.llm_cache import LLMCacheStore, SQLiteLLMCacheStore
+
+
+class PostgresLLMCacheStore(LLMCacheStore):
+    """
+    llm_cache_entries テーブルに保存するストア。複数のプロセスでキャッシュを共有できる。
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        ttl_seconds: int,
+        max_entries: int,
+    ):
+        super().__init__(ttl_seconds, max_entries)
+        self.session_factory = session_factory
+
+    def _cutoff(self) -> datetime:
+        return datetime.now(ZoneInfo("Asia/Tokyo")) - timedelta(
+            seconds=self.ttl_seconds
+        )
+
+    async def get(self, key: str) -> str | None:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(syagent_model.LLMCacheEntry.value)
+                .filter_by(key=key)
+                .where(syagent_model.LLMCacheEntry.created_at >= self._cutoff())
+            )
+            return result.scalar()
+
+    async def set(self, key: str, value: str) -> None:
+        now = datetime.now(ZoneInfo("Asia/Tokyo"))
+        entry = syagent_model.LLMCacheEntry
+        async with self.session_factory() as db:
+            await db.execute(
+                insert(entry)
+                .values(key=key, value=value, created_at=now, updated_at=now)
+                .on_conflict_do_update(
+                    index_elements=[entry.key],
+                    set_={"value": value, "created_at": now, "updated_at": now},
+                )
+            )
+            await db.execute(delete(entry).where(entry.created_at < self._cutoff()))
+            overflow = (
+                select(entry.key)
+                .order_by(entry.created_at.desc())
+                .offset(self.max_entries)
+            )
+            await db.execute(delete(entry).where(entry.key.in_(overflow)))
+            await db.commit()
+
+    async def clear(self) -> None:
+        async with self.session_factory() as db:
+            await db.execute(delete(syagent_model.LLMCacheEntry))
+            await db.commit()
+
+
+def create_llm_cache_store(
+    session_factory: async_sessionmaker[AsyncSession],
+) -> LLMCacheStore | None:
+    """
+    設定に応じたシミュレーション用のキャッシュストアを返す。無効な場合は None。
+    """
+    match setting.llm_cache_backend:
+        case "none":
+            return None
+        case "sqlite":
+            return SQLiteLLMCacheStore(
+                setting.llm_cache_path,
+                setting.llm_cache_ttl_seconds,
+                setting.llm_cache_max_entries,
+            )
+        case "postgres":
+            return PostgresLLMCacheStore(
+                session_factory,
+                setting.llm_cache_ttl_seconds,
+                setting.llm_cache_max_entries,
+            )
@@ -0,0 +1,93 @@
+import base64
+import binascii
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Generic, TypeVar
+
+from fastapi import HTTPException
+from sqlalchemy import ColumnElement, Select, literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Page(Generic[T]):
+    """
+    キーセットページネーションの結果。
+    before / after はそれぞれ、このページより古い行・新しい行を取得するためのカーソル。
+    """
+
+    items: list[T]
+    before: str | None
+    after: str | None
+    has_more: bool
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def paginate(
+    db: AsyncSession,
+    stmt: Select,
+    created_at: InstrumentedAttribute[Any],
+    id: InstrumentedAttribute[int],
+    limit: int,
+    before: str | None = None,
+    after: str | None = None,
+    after_key: tuple[datetime, int] | None = None,
+    newest_first: bool = False,
+) -> Page:
+    """
+    (created_at, id) をキーに、stmt の結果を1ページ分取得する。
+    before を指定するとその位置より古い行を、after を指定するとより新しい行を、
+    どちらも指定しない場合は最新の行を limit 件返す。
+    after の代わりに、カーソルを経由せず after_key に (created_at, id) を渡せる。
+    結果は newest_first に従って新しい順か古い順に並べる。
+    """
+    if before is not None and (after is not None or after_key is not None):
+        raise HTTPException(
+            status_code=400, detail="before and after cannot be used together"
+        )
+    if after is not None:
+        after_key = decode_cursor(after)
+    key = tuple_(created_at, id)
+    if after_key is not None:
+        # 続きを取得する場合のみ古い方から辿る
+        stmt = stmt.where(key > _key_value(after_key)).order_by(created_at, id)
+    else:
+        if before is not None:
+            stmt = stmt.where(key < _key_value(decode_cursor(before)))
+        stmt = stmt.order_by(created_at.desc(), id.desc())
+    rows = list((await db.execute(stmt.limit(limit + 1))).scalars().all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if (after_key is not None) == newest_first:
+        rows.reverse()
+
+    if not rows:
+        return Page(items=[], before=None, after=None, has_more=False)
+    oldest, newest = (rows[-1], rows[0]) if newest_first else (rows[0], rows[-1])
+    return Page(
+        items=rows,
+        before=encode_cursor(oldest.created_at, oldest.id),
+        after=encode_cursor(newest.created_at, newest.id),
+        has_more=has_more,
+    )
+
+
+def _key_value(key: tuple[datetime, int]) -> ColumnElement:
+    created_at, id = key
+    return tuple_(literal(created_at), literal(id))
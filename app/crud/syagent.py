@@ -1,231 +1,607 @@
+import asyncio
+from dataclasses import replace
+from datetime import datetime, timedelta
+from typing import AsyncGenerator
+from zoneinfo import ZoneInfo
+
+import anyio
 from fastapi import HTTPException
-from langchain_google_vertexai import ChatVertexAI
-from sqlalchemy.ext.asyncio import AsyncSession
+from langchain_core.language_models import BaseChatModel
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload, selectinload
 
+from app.core.config import setting
+from app.core.lazy import Lazy
+from app.core.metrics import Counter
+from app.crud import context as context_crud
+from app.crud import icon as icon_crud
+from app.crud.pagination import Page, paginate
+from app.db.metrics import observe_db_time
 from app.models import syagent as syagent_model
 from app.schemas import syagent as syagent_schema
 from app.schemas import utils as utils_schema
+from app.services.llm_cache import LLMCache
+from app.services.llm_provider import Permit, get_llm_provider
 from app.services.syagent import agents as syagent_service
-from app.services.syagent.image import generate_icon
+from app.services.syagent import components as syagent_components
+
+llm_provider = get_llm_provider()
+# モデルのクライアントは最初に使われた時に生成する。
+# ベンチマークではここを偽物のモデルに差し替える。
+llm: Lazy[BaseChatModel] = Lazy(
+    lambda: llm_provider.chat_model(setting.llm_chat_model, chain="chat")
+)
+# シミュレーションは同じプロフィールに同じ結果を返してよいため、応答をキャッシュする。
+# ストアは起動時に設定から決まり、未設定の間はキャッシュしない。
+simulation_cache = LLMCache(
+    f"simulation:{syagent_components.SIMULATION_PROMPT_VERSION}"
+)
+sim_llm: Lazy[BaseChatModel] = Lazy(
+    lambda: llm_provider.chat_model(
+        setting.llm_simulation_model, chain="simulation", cache=simulation_cache
+    )
+)
+# モデルごとの同時実行数の制限。上限を超えた分は待たせるか、429/503 で拒否する
+chat_limiter = llm_provider.limiter(setting.llm_chat_model)
+sim_limiter = llm_provider.limiter(setting.llm_simulation_model)
+# グラフとチェーンはプロセスごとに一度だけ構築し、全てのリクエストで使い回す。
+# 起動時に warm_up で、使っているモデルのクライアントとあわせて生成する
+sim_workflow = Lazy(
+    lambda: syagent_service.SimulationWorkflow(sim_llm.get()), name="sim_workflow"
+)
+chat_workflow = Lazy(
+    lambda: syagent_service.ChatWorkflow(llm.get()), name="chat_workflow"
+)
+history_summarizer = Lazy(
+    lambda: syagent_components.HistorySummarizer(llm.get()), name="history_summarizer"
+)
 
-llm = ChatVertexAI(model="gemini-1.5-flash-002")
+cancelled_streams = Counter(
+    "chat_cancelled_streams_total",
+    "読んでいるクライアントがいなくなったために中断したチャットの応答の数",
+    ("partial_message",),
+)
+conversation_jobs = Counter(
+    "conversation_jobs_total", "完了した会話作成ジョブの数", ("status",)
+)
 
 
+@observe_db_time
 async def read_conversations(
-    db: AsyncSession, user_id: str
-) -> list[syagent_schema.OutputConversation]:
+    db: AsyncSession,
+    user_id: str,
+    limit: int,
+    before: str | None = None,
+    after: str | None = None,
+) -> Page[syagent_schema.OutputConversation]:
     """
-    ユーザが持つ会話のリストを取得する。
+    ユーザが持つ会話を、新しい順に1ページ分取得する。
     """
-    result = await db.execute(
-        select(syagent_model.Conversation).filter_by(user_id=user_id)
+    page = await paginate(
+        db,
+        select(syagent_model.Conversation).filter_by(user_id=user_id),
+        syagent_model.Conversation.created_at,
+        syagent_model.Conversation.id,
+        limit,
+        before=before,
+        after=after,
+        newest_first=True,
+    )
+    return replace(
+        page,
+        items=[
+            syagent_schema.OutputConversation.model_validate(conversation)
+            for conversation in page.items
+        ],
     )
-    conversations = result.scalars().all()
-    if not conversations:
-        return []
-    return [
-        syagent_schema.OutputConversation.model_validate(conversation)
-        for conversation in conversations
-    ]
 
 
+@observe_db_time
 async def create_conversation(
     db: AsyncSession, user_id: str, current_profile: syagent_schema.CurrentProfile
 ) -> syagent_schema.OutputConversation:
     """
     ユーザの情報から、将来の自己像を生成し、会話を開始する。
+    LLM と Imagen の呼び出しを先に済ませ、その後に全ての行をまとめて保存するため、
+    生成中にトランザクションを開いたままにしない。
     """
-    # CurrentProfile 作成
-    current_profile_model = syagent_model.CurrentProfile(
-        user_id=user_id,
-        age=current_profile.age,
-        status=current_profile.status,
-        values=current_profile.values,
-        restrictions=current_profile.restrictions,
-        extra=current_profile.extra,
+    # シミュレーションワークフローにより将来の自己像を生成
+    llm_provider.check_available(setting.llm_simulation_model, chain="simulation")
+    async with sim_limiter.slot():
+        generated_future_profile = await sim_workflow.get().agenerate(current_profile)
+    icon_hash = await icon_crud.get_icon_hash(
+        async_sessionmaker(db.bind, expire_on_commit=False),
+        generated_future_profile.summary,
     )
-    db.add(current_profile_model)
-    await db.flush()
 
-    # CurrentSkill, FutureGoal 作成
-    # スキルの登録
-    current_skills = [
-        syagent_model.CurrentSkill(
-            current_profile_id=current_profile_model.id, skill=skill
-        )
-        for skill in current_profile.skills
-    ]
-    for skill in current_skills:
-        db.add(skill)
-
-    # 目標の登録
-    future_goals = [
-        syagent_model.FutureGoal(current_profile_id=current_profile_model.id, goal=goal)
-        for goal in current_profile.future_goals
-    ]
-    for goal in future_goals:
-        db.add(goal)
-
-    # FutureProfile 作成
-    # シミュレーションワークフローにより将来の自己像を生成
-    sim_wf = syagent_service.SimulationWorkflow(llm, current_profile)
-    generated_future_profile = sim_wf.generate()
-    future_profile = syagent_model.FutureProfile(
-        user_id=user_id,
-        current_profile_id=current_profile_model.id,
-        status=generated_future_profile.status,
-        time_frame=generated_future_profile.time_frame,
-        summary=generated_future_profile.summary,
-    )
-    db.add(future_profile)
-    await db.flush()  # future_profile.id が取得可能になる
-
-    # FutureSkill 作成
-    future_skills = [
-        syagent_model.FutureSkill(future_profile_id=future_profile.id, skill=skill)
-        for skill in generated_future_profile.skills
-    ]
-    for skill in future_skills:
-        db.add(skill)
-
-    # Conversation 作成
-    conversation = syagent_model.Conversation(
-        user_id=user_id,
-        future_profile_id=future_profile.id,
-        title=future_profile.summary,
-        icon=generate_icon(future_profile.summary),
+    current_profile_id = await _add_current_profile(db, user_id, current_profile)
+    conversation = await _add_conversation(
+        db, user_id, current_profile_id, generated_future_profile, icon_hash
     )
-    db.add(conversation)
-    await db.flush()
 
     # Pydantic スキーマに変換して返却
     return syagent_schema.OutputConversation.model_validate(conversation)
 
 
-async def read_messages(
-    db: AsyncSession, conversation_id: int
-) -> list[syagent_schema.OutputMessage]:
+async def _add_current_profile(
+    db: AsyncSession, user_id: str, current_profile: syagent_schema.CurrentProfile
+) -> int:
+    """
+    CurrentProfile と、そのスキル・目標を保存し、CurrentProfile の ID を返す。
+    スキルと目標はテーブルごとに複数行の INSERT 1回で保存する。
+    """
     result = await db.execute(
-        select(syagent_model.Message).filter_by(conversation_id=conversation_id)
+        insert(syagent_model.CurrentProfile)
+        .values(
+            user_id=user_id,
+            age=current_profile.age,
+            status=current_profile.status,
+            values=current_profile.values,
+            restrictions=current_profile.restrictions,
+            extra=current_profile.extra,
+        )
+        .returning(syagent_model.CurrentProfile.id)
+    )
+    current_profile_id = result.scalar_one()
+    await _insert_rows(
+        db,
+        syagent_model.CurrentSkill,
+        [
+            {"current_profile_id": current_profile_id, "skill": skill}
+            for skill in current_profile.skills
+        ],
+    )
+    await _insert_rows(
+        db,
+        syagent_model.FutureGoal,
+        [
+            {"current_profile_id": current_profile_id, "goal": goal}
+            for goal in current_profile.future_goals
+        ],
     )
-    messages = result.scalars().all()
-    if not messages:
-        return []
-    return [
-        syagent_schema.OutputMessage.model_validate(message) for message in messages
-    ]
+    return current_profile_id
 
 
-async def create_message(
-    db: AsyncSession, conversation_id: int, input_message: syagent_schema.InputMessage
-) -> list[str]:
-    # conversation取得
-    conversation_result = await db.execute(
-        select(syagent_model.Conversation).filter_by(id=conversation_id)
+async def _add_conversation(
+    db: AsyncSession,
+    user_id: str,
+    current_profile_id: int,
+    generated_future_profile: syagent_schema.FutureProfile,
+    icon_hash: str,
+) -> syagent_model.Conversation:
+    """
+    FutureProfile と、そのスキル、Conversation を保存する。
+    """
+    result = await db.execute(
+        insert(syagent_model.FutureProfile)
+        .values(
+            user_id=user_id,
+            current_profile_id=current_profile_id,
+            status=generated_future_profile.status,
+            time_frame=generated_future_profile.time_frame,
+            summary=generated_future_profile.summary,
+        )
+        .returning(syagent_model.FutureProfile.id)
     )
-    conversation = conversation_result.scalar()
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-
-    # messages取得
-    messages_result = await db.execute(
-        select(syagent_model.Message).filter_by(conversation_id=conversation_id)
-    )
-    messages = messages_result.scalars().all()
-    if not messages:
-        messages = []
-
-    # future_profile取得
-    future_profile_result = await db.execute(
-        select(syagent_model.FutureProfile).filter_by(id=conversation.future_profile_id)
-    )
-    future_profile = future_profile_result.scalar()
-    if not future_profile:
-        raise HTTPException(status_code=404, detail="Futureprofile not found")
-    # future_skills取得
-    future_skills_result = await db.execute(
-        select(syagent_model.FutureSkill).filter_by(future_profile_id=future_profile.id)
-    )
-    future_skills = future_skills_result.scalars().all()
-    if not future_skills:
-        future_skills = []
-
-    # current_profile取得
-    current_profile_result = await db.execute(
-        select(syagent_model.CurrentProfile).filter_by(
-            id=future_profile.current_profile_id
+    future_profile_id = result.scalar_one()
+    await _insert_rows(
+        db,
+        syagent_model.FutureSkill,
+        [
+            {"future_profile_id": future_profile_id, "skill": skill}
+            for skill in generated_future_profile.skills
+        ],
+    )
+    result = await db.execute(
+        insert(syagent_model.Conversation)
+        .values(
+            user_id=user_id,
+            future_profile_id=future_profile_id,
+            title=generated_future_profile.summary,
+            icon_hash=icon_hash,
         )
+        .returning(syagent_model.Conversation)
     )
-    current_profile = current_profile_result.scalar()
-    if not current_profile:
-        raise HTTPException(status_code=404, detail="CurrentProfile not found")
-    # current_skills取得
-    current_skills_result = await db.execute(
-        select(syagent_model.CurrentSkill).filter_by(
-            current_profile_id=current_profile.id
+    return result.scalar_one()
+
+
+async def _insert_rows(db: AsyncSession, model: type, rows: list[dict]) -> None:
+    # 複数行の INSERT 1回で保存される（行がなければ何もしない）
+    if rows:
+        await db.execute(insert(model), rows)
+
+
+@observe_db_time
+async def create_conversation_job(
+    db: AsyncSession, user_id: str, current_profile: syagent_schema.CurrentProfile
+) -> syagent_schema.OutputJob:
+    """
+    CurrentProfile を保存し、会話作成ジョブを登録する。
+    ジョブの実行は run_conversation_job がバックグラウンドで行う。
+    """
+    current_profile_id = await _add_current_profile(db, user_id, current_profile)
+    job = syagent_model.ConversationJob(
+        user_id=user_id,
+        current_profile_id=current_profile_id,
+        status="queued",
+        conversation=None,
+    )
+    db.add(job)
+    await db.flush()
+    return syagent_schema.OutputJob.model_validate(job)
+
+
+async def prime_statements(db: AsyncSession) -> None:
+    """
+    読み取りの多いクエリを、存在しないユーザや会話で1回ずつ実行する。
+    起動時に接続ごとに呼び、asyncpg のプリペアドステートメントと型の情報、
+    SQLAlchemy のコンパイル済みのクエリを、最初のリクエストの前にキャッシュする。
+    書き込みのクエリは実行できないため対象にしない。
+    """
+    await read_conversations(db, "", limit=1)
+    await read_messages(db, 0, limit=1)
+    try:
+        await read_job(db, 0)
+    except HTTPException:
+        pass
+    await context_crud.prime_statements(db)
+    await icon_crud.prime_statements(db)
+
+
+@observe_db_time
+async def read_job(db: AsyncSession, job_id: int) -> syagent_schema.OutputJob:
+    result = await db.execute(
+        select(syagent_model.ConversationJob)
+        .options(joinedload(syagent_model.ConversationJob.conversation))
+        .filter_by(id=job_id)
+    )
+    job = result.scalar()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return syagent_schema.OutputJob.model_validate(job)
+
+
+@observe_db_time
+async def read_pending_job_ids(db: AsyncSession, stale_seconds: int) -> list[int]:
+    """
+    再投入が必要なジョブのIDを取得する。
+    実行中のまま一定時間更新されていないジョブは、停止したワーカーのものとみなして戻す。
+    """
+    cutoff = datetime.now(ZoneInfo("Asia/Tokyo")) - timedelta(seconds=stale_seconds)
+    await db.execute(
+        update(syagent_model.ConversationJob)
+        .where(
+            syagent_model.ConversationJob.status == "running",
+            syagent_model.ConversationJob.updated_at < cutoff,
         )
+        .values(status="queued", stage=None)
+    )
+    result = await db.execute(
+        select(syagent_model.ConversationJob.id)
+        .filter_by(status="queued")
+        .order_by(syagent_model.ConversationJob.id)
     )
-    current_skills = current_skills_result.scalars().all()
-    if not current_skills:
-        current_skills = []
-    # future_goals取得
-    future_goals_result = await db.execute(
-        select(syagent_model.FutureGoal).filter_by(
-            current_profile_id=current_profile.id
+    return list(result.scalars().all())
+
+
+@observe_db_time
+async def run_conversation_job(
+    session_factory: async_sessionmaker[AsyncSession], job_id: int
+) -> None:
+    """
+    会話作成ジョブを実行する。
+    LLM と Imagen の呼び出し中はセッションを保持しない。
+    """
+    async with session_factory() as db:
+        # queued から running に更新できたワーカーのみが実行する
+        claimed = await db.execute(
+            update(syagent_model.ConversationJob)
+            .where(
+                syagent_model.ConversationJob.id == job_id,
+                syagent_model.ConversationJob.status == "queued",
+            )
+            .values(status="running", stage="simulating")
+            .returning(
+                syagent_model.ConversationJob.user_id,
+                syagent_model.ConversationJob.current_profile_id,
+            )
         )
+        row = claimed.one_or_none()
+        if row is None:
+            return
+        user_id, current_profile_id = row
+        current_profile = await _read_current_profile(db, current_profile_id)
+        await db.commit()
+
+    try:
+        # ジョブは既に受け付けているため、拒否せずに実行枠が空くまで待つ
+        async with sim_limiter.slot(block=True):
+            generated_future_profile = await sim_workflow.get().agenerate(
+                current_profile
+            )
+        await _update_job(session_factory, job_id, stage="generating_icon")
+        icon_hash = await icon_crud.get_icon_hash(
+            session_factory, generated_future_profile.summary
+        )
+        await _update_job(session_factory, job_id, stage="saving")
+        async with session_factory() as db:
+            conversation = await _add_conversation(
+                db, user_id, current_profile_id, generated_future_profile, icon_hash
+            )
+            await db.execute(
+                update(syagent_model.ConversationJob)
+                .filter_by(id=job_id)
+                .values(status="succeeded", stage=None, conversation_id=conversation.id)
+            )
+            await db.commit()
+        conversation_jobs.inc(status="succeeded")
+    except Exception as e:
+        conversation_jobs.inc(status="failed")
+        await _update_job(
+            session_factory, job_id, status="failed", stage=None, error=str(e)
+        )
+        raise
+
+
+async def _update_job(
+    session_factory: async_sessionmaker[AsyncSession], job_id: int, **values
+) -> None:
+    async with session_factory() as db:
+        await db.execute(
+            update(syagent_model.ConversationJob).filter_by(id=job_id).values(**values)
+        )
+        await db.commit()
+
+
+async def _read_current_profile(
+    db: AsyncSession, current_profile_id: int
+) -> syagent_schema.CurrentProfile:
+    result = await db.execute(
+        select(syagent_model.CurrentProfile)
+        .options(
+            selectinload(syagent_model.CurrentProfile.current_skills),
+            selectinload(syagent_model.CurrentProfile.future_goals),
+        )
+        .filter_by(id=current_profile_id)
+    )
+    current_profile = result.scalar_one()
+    return syagent_schema.CurrentProfile(
+        age=current_profile.age,
+        status=current_profile.status,
+        skills=[skill.skill for skill in current_profile.current_skills],
+        values=current_profile.values,
+        restrictions=current_profile.restrictions,
+        future_goals=[goal.goal for goal in current_profile.future_goals],
+        extra=current_profile.extra,
     )
-    future_goals = future_goals_result.scalars().all()
-    if not future_goals:
-        future_goals = []
 
-    # chat_workflow
-    chat_wf = syagent_service.ChatWorkflow(
-        llm,
-        syagent_schema.CurrentProfile(
-            age=current_profile.age,  ###Placeholder
-            status=current_profile.status,
-            skills=[skill.skill for skill in current_skills] if current_skills else [],
-            values=current_profile.values,  ###Placeholder
-            restrictions=current_profile.restrictions,  ###Placeholder
-            future_goals=[goal.goal for goal in future_goals] if future_goals else [],
-            extra=current_profile.extra,  ###Placeholder
-        ),
-        syagent_schema.FutureProfile(
-            status=future_profile.status,
-            time_frame=future_profile.time_frame,
-            skills=[skill.skill for skill in future_skills] if future_skills else [],
-            summary=future_profile.summary,  ###Placeholder
-        ),
-    )
-    history = []
-    if messages:
-        for message in messages:
-            if message.role == "user":
-                history.append(
-                    syagent_schema.RoleMessage(role="user", content=message.message)
-                )
-            elif message.role == "agent":
-                history.append(
-                    syagent_schema.RoleMessage(role="agent", content=message.message)
-                )
-    user_input = input_message.message
+
+@observe_db_time
+async def read_messages(
+    db: AsyncSession,
+    conversation_id: int,
+    limit: int,
+    before: str | None = None,
+    after: str | None = None,
+    since: int | None = None,
+) -> Page[syagent_schema.OutputMessage]:
+    """
+    会話のメッセージを、古い順に1ページ分取得する。
+    since を指定すると、そのIDのメッセージより新しいメッセージのみを返す。
+    """
+    after_key = None
+    if since is not None:
+        if after is not None or before is not None:
+            raise HTTPException(
+                status_code=400,
+                detail="since cannot be used together with before or after",
+            )
+        since_message = (
+            await db.execute(
+                select(
+                    syagent_model.Message.conversation_id,
+                    syagent_model.Message.created_at,
+                ).filter_by(id=since)
+            )
+        ).one_or_none()
+        if since_message is None:
+            raise HTTPException(status_code=404, detail="Message not found")
+        if since_message.conversation_id != conversation_id:
+            raise HTTPException(
+                status_code=400,
+                detail="Message does not belong to the conversation",
+            )
+        after_key = (since_message.created_at, since)
+    page = await paginate(
+        db,
+        select(syagent_model.Message).filter_by(conversation_id=conversation_id),
+        syagent_model.Message.created_at,
+        syagent_model.Message.id,
+        limit,
+        before=before,
+        after=after,
+        after_key=after_key,
+    )
+    return replace(
+        page,
+        items=[
+            syagent_schema.OutputMessage.model_validate(message)
+            for message in page.items
+        ],
+    )
+
+
+@observe_db_time
+async def create_message(
+    db: AsyncSession,
+    session_factory: async_sessionmaker[AsyncSession],
+    conversation_id: int,
+    input_message: syagent_schema.InputMessage,
+) -> AsyncGenerator[syagent_schema.StreamChunk | syagent_schema.StreamEnd, None]:
+    """
+    会話に必要な情報を db で取得し、応答をストリーミングする非同期ジェネレータを返す。
+    存在しない会話の場合や、LLM の回路が開いているか実行枠を得られない場合は、
+    ストリーム開始前にエラーを返す。実行枠はストリームの終了まで保持するため、
+    返したジェネレータは必ず読み始め、最後まで読むか aclose する。
+    ジェネレータはリクエストより長く動くことがあるため、db ではなく
+    session_factory のセッションで応答を保存する。
+    """
+    context = await context_crud.load_conversation_context(db, conversation_id)
+
+    state = context.to_chat_state(input_message.message)
+    llm_provider.check_available(setting.llm_chat_model, chain="chat")
+    permit = await chat_limiter.acquire()
+    try:
+        chat_wf = chat_workflow.get()
+    except BaseException:
+        # ストリームを返せない場合は、ここで実行枠を戻す
+        permit.release()
+        raise
+    return _stream_message(
+        session_factory, chat_wf, permit, conversation_id, state, input_message
+    )
+
+
+@observe_db_time
+async def _stream_message(
+    session_factory: async_sessionmaker[AsyncSession],
+    chat_wf: syagent_service.ChatWorkflow,
+    permit: Permit,
+    conversation_id: int,
+    state: syagent_schema.ChatState,
+    input_message: syagent_schema.InputMessage,
+) -> AsyncGenerator[syagent_schema.StreamChunk | syagent_schema.StreamEnd, None]:
+    """
+    生成されたチャンクを逐次返し、ストリーム終了後にメッセージを保存する。
+    読んでいるクライアントがいなくなって中断された場合は、生成を止め、
+    chat_cancelled_message_policy に従って途中までの応答を保存するか捨てる。
+    """
     st_message = ""
-    streaming_messages: list[str] = []
-    async for chunk in chat_wf.process_input(history, user_input):
-        st_message += str(chunk)
-        streaming_messages.append(str(chunk))
+    seq = 0
+    try:
+        try:
+            async for chunk in chat_wf.process_state(state):
+                st_message += str(chunk)
+                yield syagent_schema.StreamChunk(seq=seq, content=str(chunk))
+                seq += 1
+        except (asyncio.CancelledError, GeneratorExit):
+            save = setting.chat_cancelled_message_policy == "save" and bool(st_message)
+            cancelled_streams.inc(partial_message="saved" if save else "discarded")
+            if save:
+                # キャンセルの中でも、保存が終わるまでは中断させない
+                with anyio.CancelScope(shield=True):
+                    await _save_messages(
+                        session_factory, conversation_id, input_message, st_message
+                    )
+            raise
+        message, output_message = await _save_messages(
+            session_factory, conversation_id, input_message, st_message
+        )
+        yield syagent_schema.StreamEnd(
+            message_id=output_message.id, user_message_id=message.id, chunks=seq
+        )
+    finally:
+        permit.release()
+
+
+async def _save_messages(
+    session_factory: async_sessionmaker[AsyncSession],
+    conversation_id: int,
+    input_message: syagent_schema.InputMessage,
+    response: str,
+) -> tuple[syagent_model.Message, syagent_model.Message]:
     message = syagent_model.Message(
         conversation_id=conversation_id, role="user", **input_message.model_dump()
     )
     output_message = syagent_model.Message(
-        conversation_id=conversation_id, role="agent", message=st_message
+        conversation_id=conversation_id, role="agent", message=response
     )
-    db.add(message)
-    db.add(output_message)
-    return streaming_messages
+    # 生成中は接続を保持せず、保存する時だけセッションを開く
+    async with session_factory() as db:
+        db.add(message)
+        db.add(output_message)
+        await db.flush()  # message.id, output_message.id が取得可能になる
+        await db.commit()
+    return message, output_message
+
+
+@observe_db_time
+async def update_conversation_summary(
+    session_factory: async_sessionmaker[AsyncSession], conversation_id: int
+) -> None:
+    """
+    要約に取り込まれていないメッセージが一定数を超えたら、古い方から要約に畳み込む。
+    直近の chat_history_window_messages 件はそのまま履歴として残す。
+    要約中は DB セッションを保持せず、同時に更新された場合は後から来た方を捨てる。
+    """
+    window = setting.chat_history_window_messages
+    async with session_factory() as db:
+        summary = (
+            await db.execute(
+                select(syagent_model.ConversationSummary).filter_by(
+                    conversation_id=conversation_id
+                )
+            )
+        ).scalar()
+        old_summary = summary.summary if summary else ""
+        until_id = summary.summarized_until_id if summary else 0
+        result = await db.execute(
+            select(
+                syagent_model.Message.role,
+                syagent_model.Message.message,
+                syagent_model.Message.id,
+            )
+            .where(
+                syagent_model.Message.conversation_id == conversation_id,
+                syagent_model.Message.id > until_id,
+            )
+            .order_by(syagent_model.Message.id)
+        )
+        rows = result.all()
+    if len(rows) < window + setting.chat_summary_batch_messages:
+        return
+
+    folded = rows[: len(rows) - window]
+    # バックグラウンドの処理のため、拒否せずに実行枠が空くまで待つ
+    async with chat_limiter.slot(block=True):
+        new_summary = await history_summarizer.get().arun(
+            old_summary,
+            [
+                syagent_schema.RoleMessage(role=role, content=message)
+                for role, message, _ in folded
+            ],
+        )
+    new_until_id = folded[-1][2]
+
+    async with session_factory() as db:
+        if summary is None:
+            db.add(
+                syagent_model.ConversationSummary(
+                    conversation_id=conversation_id,
+                    summary=new_summary,
+                    summarized_until_id=new_until_id,
+                )
+            )
+            try:
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()
+            return
+        await db.execute(
+            update(syagent_model.ConversationSummary)
+            .where(
+                syagent_model.ConversationSummary.conversation_id == conversation_id,
+                syagent_model.ConversationSummary.summarized_until_id == until_id,
+            )
+            .values(summary=new_summary, summarized_until_id=new_until_id)
+        )
+        await db.commit()
 
 
+@observe_db_time
 async def delete_conversation(db: AsyncSession, conversation_id: int):
     result = await db.execute(
         select(syagent_model.Conversation).filter_by(id=conversation_id)
@@ -234,4 +610,5 @@ async def delete_conversation(db: AsyncSession, conversation_id: int):
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     await db.delete(conversation)
+    context_crud.invalidate_conversation_context(conversation_id)
     return utils_schema.ResponseMessage(status=204, message="Conversation deleted")
@@ -0,0 +1,79 @@
+import inspect
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.metrics import Histogram
+
+db_time = Histogram(
+    "db_time_seconds",
+    "CRUD 関数の1回の呼び出しで SQL の実行にかかった時間の合計",
+    ("function",),
+)
+
+# 実行中の CRUD 関数ごとの、SQL の実行時間の累計
+_accumulators: ContextVar[tuple[list[float], ...]] = ContextVar(
+    "db_time_accumulators", default=()
+)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    エンジンが実行した SQL の時間を、実行中の CRUD 関数に加算する。
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        for accumulator in _accumulators.get():
+            accumulator[0] += elapsed
+
+
+def observe_db_time(func):
+    """
+    関数の実行中に発行された SQL の時間の合計を db_time_seconds に記録する。
+    コルーチン関数と非同期ジェネレータ関数に使える。
+    """
+    name = func.__name__
+
+    if inspect.isasyncgenfunction(func):
+
+        @wraps(func)
+        async def gen_wrapper(*args, **kwargs):
+            accumulator = [0.0]
+            gen = func(*args, **kwargs)
+            try:
+                while True:
+                    # yield をまたいで ContextVar を変更しないよう、1ステップごとに設定
+                    token = _accumulators.set(_accumulators.get() + (accumulator,))
+                    try:
+                        item = await gen.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        _accumulators.reset(token)
+                    yield item
+            finally:
+                await gen.aclose()
+                db_time.observe(accumulator[0], function=name)
+
+        return gen_wrapper
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        accumulator = [0.0]
+        token = _accumulators.set(_accumulators.get() + (accumulator,))
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _accumulators.reset(token)
+            db_time.observe(accumulator[0], function=name)
+
+    return wrapper
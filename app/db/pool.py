@@ -0,0 +1,70 @@
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+
+@dataclass
+class PoolStats:
+    name: str
+    size: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    wait_seconds_total: float
+    wait_seconds_max: float
+
+
+class PoolMetrics:
+    """
+    接続プールから接続を取得するまでの待ち時間と回数を記録する。
+    """
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def observe(self, wait_seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_seconds_total += wait_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def stats(self, name: str, pool: Pool) -> PoolStats:
+        # checkedout などは QueuePool のみが持つ
+        return PoolStats(
+            name=name,
+            size=getattr(pool, "size", lambda: 0)(),
+            checked_out=getattr(pool, "checkedout", lambda: 0)(),
+            checked_in=getattr(pool, "checkedin", lambda: 0)(),
+            # QueuePool は接続数が pool_size に満たない間は負の値を返す
+            overflow=max(0, getattr(pool, "overflow", lambda: 0)()),
+            checkouts=self.checkouts,
+            timeouts=self.timeouts,
+            wait_seconds_total=self.wait_seconds_total,
+            wait_seconds_max=self.wait_seconds_max,
+        )
+
+
+def instrumented_pool_class(metrics: PoolMetrics) -> type[AsyncAdaptedQueuePool]:
+    """
+    接続の取得ごとに metrics へ待ち時間を記録するプールクラスを返す。
+    新しい接続を張る場合は、その時間も待ち時間に含まれる。
+    """
+
+    class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.timeouts += 1
+                raise
+            metrics.observe(time.perf_counter() - start)
+            return connection
+
+    return InstrumentedAsyncQueuePool
@@ -1,16 +1,129 @@
-from typing import AsyncGenerator
+import asyncio
+import random
+from typing import AsyncGenerator, Awaitable, Callable
+from uuid import uuid4
 
 from fastapi import FastAPI, Request
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 
 from app.core.config import setting
+from app.db.metrics import instrument_engine
+from app.db.pool import PoolMetrics, instrumented_pool_class
+
+
+def create_engine(url: str, metrics: PoolMetrics) -> AsyncEngine:
+    """
+    設定に従って接続プールを構成したエンジンを作成する。
+    """
+    connect_args: dict = {
+        "statement_cache_size": setting.db_statement_cache_size,
+        "prepared_statement_cache_size": setting.db_prepared_statement_cache_size,
+    }
+    if setting.db_pgbouncer:
+        # トランザクションモードでは接続ごとに別のサーバ接続が使われうるため、
+        # プリペアドステートメントを使い回さず、名前も一意にする
+        connect_args = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    engine = create_async_engine(
+        url,
+        echo=False,
+        poolclass=instrumented_pool_class(metrics),
+        pool_size=setting.db_pool_size,
+        max_overflow=setting.db_max_overflow,
+        pool_timeout=setting.db_pool_timeout,
+        pool_recycle=setting.db_pool_recycle,
+        pool_pre_ping=setting.db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+    instrument_engine(engine)
+    return engine
 
 
 def setup_db(app: FastAPI) -> None:
-    engine = create_async_engine(setting.get_postgres_uri, echo=False)
+    metrics = PoolMetrics()
+    engine = create_engine(setting.get_postgres_uri, metrics)
     session = async_sessionmaker(engine, expire_on_commit=False)
     app.state.db_engine = engine
     app.state.db_session = session
+    # 接続先の名前 -> (エンジン, プールの統計)
+    app.state.db_pools = {"primary": (engine, metrics)}
+
+    read_engines = []
+    for i, uri in enumerate(setting.postgres_replica_uris):
+        replica_metrics = PoolMetrics()
+        replica_engine = create_engine(uri, replica_metrics)
+        app.state.db_pools[f"replica-{i}"] = (replica_engine, replica_metrics)
+        read_engines.append(replica_engine)
+    # 読み取り専用のセッションは AUTOCOMMIT にして、BEGIN と COMMIT を発行しない
+    app.state.db_read_sessions = [
+        async_sessionmaker(
+            read_engine.execution_options(isolation_level="AUTOCOMMIT"),
+            expire_on_commit=False,
+        )
+        for read_engine in read_engines or [engine]
+    ]
+
+
+async def warm_up_db(
+    app: FastAPI,
+    connections: int,
+    prime: Callable[[AsyncSession], Awaitable[None]] | None = None,
+) -> None:
+    """
+    各接続先に connections 本の接続を同時に張り、それぞれで prime を実行してから
+    プールに戻す。最初のリクエストが、接続の確立や asyncpg の型の問い合わせ、
+    ステートメントの準備を待たないようにする。
+    """
+    # プールが保持する数を超えた接続は、戻した時に閉じられてしまう
+    connections = max(1, min(connections, setting.db_pool_size))
+
+    async def warm_up_connection(engine: AsyncEngine, barrier: asyncio.Barrier):
+        try:
+            async with engine.connect() as conn:
+                if prime is None:
+                    await conn.execute(text("SELECT 1"))
+                else:
+                    async with AsyncSession(bind=conn) as db:
+                        await prime(db)
+                await conn.rollback()
+                # 全ての接続を張り終えるまで戻さず、同じ接続が使い回されないようにする
+                await barrier.wait()
+        except Exception:
+            await barrier.abort()
+            raise
+
+    async def warm_up_engine(engine: AsyncEngine) -> None:
+        barrier = asyncio.Barrier(connections)
+        results = await asyncio.gather(
+            *(warm_up_connection(engine, barrier) for _ in range(connections)),
+            return_exceptions=True,
+        )
+        errors = [
+            result
+            for result in results
+            if isinstance(result, Exception)
+            and not isinstance(result, asyncio.BrokenBarrierError)
+        ]
+        if errors:
+            raise errors[0]
+
+    await asyncio.gather(
+        *(warm_up_engine(engine) for engine, _ in app.state.db_pools.values())
+    )
+
+
+async def teardown_db(app: FastAPI) -> None:
+    for engine, _ in app.state.db_pools.values():
+        await engine.dispose()
 
 
 async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
@@ -20,3 +133,16 @@ async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
     finally:
         await session.commit()
         await session.close()
+
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    読み取り専用のセッション。レプリカが設定されていればいずれかに接続する。
+    commit しないため、書き込みには使わないこと。
+    レプリカの遅延により、直前に書き込んだ内容が見えない場合がある。
+    """
+    session: AsyncSession = random.choice(request.app.state.db_read_sessions)()
+    try:
+        yield session
+    finally:
+        await session.close()
@@ -1,19 +1,108 @@
+import asyncio
+import logging
+import time
 from contextlib import asynccontextmanager
+from functools import partial
 from typing import AsyncGenerator
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from app.api.api import api_router
+from app.api.middleware import MetricsMiddleware, ProfilingMiddleware
+from app.core import lazy, metrics
 from app.core.config import setting
-from app.db.session import setup_db
+from app.core.profiler import profiler
+from app.crud import icon as icon_crud
+from app.crud import llm_cache as llm_cache_crud
+from app.crud import syagent as syagent_crud
+from app.db.session import setup_db, teardown_db, warm_up_db
+from app.schemas import system as system_schema
+from app.services.jobs import InProcessJobQueue
+from app.services.llm_provider import LLMOverloaded
+from app.services.resilience import CircuitOpen
+from app.services.streams import stop_streams
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_up(app: FastAPI) -> None:
+    """
+    モデルのクライアントの生成と、DB への接続とステートメントの準備を並行して行い、
+    全て成功したら ready にする。
+    失敗したものは間隔を空けて再試行し、それまでは ready にしない。
+    """
+    start = time.perf_counter()
+
+    # pgbouncer 経由ではステートメントをキャッシュしないため準備しない
+    prime = None
+    if setting.db_warmup_prime_statements and not setting.db_pgbouncer:
+        prime = syagent_crud.prime_statements
+
+    async def db() -> dict[str, bool]:
+        try:
+            await warm_up_db(app, setting.db_warmup_connections, prime)
+        except Exception:
+            logger.exception("failed to warm up database")
+            return {"db": False}
+        return {"db": True}
+
+    components: dict[str, bool] = {}
+    delay = setting.warmup_retry_base_seconds
+    while True:
+        # 生成済みのクライアントはすぐに返るが、DB は接続し直すため成功済みなら飛ばす
+        tasks = [lazy.warm_up()]
+        if not components.get("db"):
+            tasks.append(db())
+        for result in await asyncio.gather(*tasks):
+            components |= result
+        ready = all(components.values())
+        app.state.readiness = system_schema.Readiness(
+            ready=ready, components=dict(components)
+        )
+        if ready:
+            break
+        failed = [name for name, ok in components.items() if not ok]
+        logger.warning("warm-up failed for %s, retrying in %.1fs", failed, delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, setting.warmup_retry_max_seconds)
+    logger.info("warmed up in %.2fs", time.perf_counter() - start)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator:
     setup_db(app)
+    # 準備は待たずにリクエストの受け付けを始め、/api/system/ready で完了を知らせる
+    app.state.readiness = system_schema.Readiness(ready=False, components={})
+    warming = asyncio.create_task(warm_up(app))
+    syagent_crud.simulation_cache.store = llm_cache_crud.create_llm_cache_store(
+        app.state.db_session
+    )
+    app.state.job_queue = InProcessJobQueue(
+        partial(syagent_crud.run_conversation_job, app.state.db_session),
+        workers=setting.conversation_job_workers,
+    )
+    await app.state.job_queue.start()
+    # 前回停止時に未完了だったジョブを再投入する
+    async with app.state.db_session() as db:
+        job_ids = await syagent_crud.read_pending_job_ids(
+            db, setting.conversation_job_stale_seconds
+        )
+        await db.commit()
+    for job_id in job_ids:
+        await app.state.job_queue.enqueue(job_id)
+    prewarm_icons = asyncio.create_task(
+        icon_crud.prewarm_icon_pools(
+            app.state.db_session, setting.icon_prewarm_summaries
+        )
+    )
     yield
-    app.state.db_engine.dispose()
+    warming.cancel()
+    prewarm_icons.cancel()
+    await stop_streams()
+    await app.state.job_queue.stop()
+    await teardown_db(app)
 
 
 app = FastAPI(lifespan=lifespan)
@@ -25,6 +114,50 @@ if setting.allow_cors_origins:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[
+            "X-Before-Cursor",
+            "X-After-Cursor",
+            "X-Has-More",
+            "X-Profile-Id",
+            "Retry-After",
+            "X-Stream-Id",
+        ],
     )
 
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(
+    ProfilingMiddleware,
+    profiler=profiler,
+    token=setting.profiling_token,
+    sample_rate=setting.profiling_sample_rate,
+)
+
 app.include_router(api_router, prefix="/api")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.exception_handler(LLMOverloaded)
+async def handle_llm_overloaded(request: Request, exc: LLMOverloaded) -> JSONResponse:
+    # 待ち行列が一杯の場合はクライアントに間隔を空けさせ、
+    # 待ち時間の上限に達した場合はサービスが一時的に利用できないことを返す
+    return JSONResponse(
+        {"detail": "The model is overloaded. Please retry later."},
+        status_code=429 if exc.reason == "queue_full" else 503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(CircuitOpen)
+async def handle_circuit_open(request: Request, exc: CircuitOpen) -> JSONResponse:
+    # 外部サービスの障害中は、待たせずに失敗させる
+    return JSONResponse(
+        {"detail": "The upstream service is unavailable. Please retry later."},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
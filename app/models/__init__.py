@@ -1,5 +1,14 @@
 from app.db.base import Base
-from app.models.syagent import Conversation, CurrentProfile, FutureProfile, Message
+from app.models.syagent import (
+    Conversation,
+    ConversationJob,
+    ConversationSummary,
+    CurrentProfile,
+    FutureProfile,
+    IconCacheEntry,
+    LLMCacheEntry,
+    Message,
+)
 
 __all__ = (
     "Base",
@@ -7,4 +16,8 @@ __all__ = (
     "FutureProfile",
     "Conversation",
     "Message",
+    "ConversationSummary",
+    "ConversationJob",
+    "IconCacheEntry",
+    "LLMCacheEntry",
 )
@@ -1,4 +1,4 @@
-from sqlalchemy import BigInteger, ForeignKey, String
+from sqlalchemy import BigInteger, ForeignKey, Index, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
@@ -53,6 +53,10 @@ class FutureProfile(Base, TimestampMixin):
 
 class Conversation(Base, TimestampMixin):
     __tablename__ = "conversations"
+    # ユーザごとの会話一覧を (created_at, id) 順にページングするため
+    __table_args__ = (
+        Index("ix_conversations_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
     user_id: Mapped[str] = mapped_column(String, nullable=False)  # Firebase uid
@@ -63,17 +67,31 @@ class Conversation(Base, TimestampMixin):
         unique=True,
     )
     title: Mapped[str] = mapped_column(String, nullable=False)
-    icon: Mapped[str] = mapped_column(String, nullable=False)
+    icon_hash: Mapped[str] = mapped_column(String(64), nullable=False)  # SHA-256
     future_profile: Mapped["FutureProfile"] = relationship(
         "FutureProfile", back_populates="conversation"
     )
     messages: Mapped[list["Message"]] = relationship(
         "Message", back_populates="conversation", cascade="all, delete-orphan"
     )
+    summary: Mapped["ConversationSummary | None"] = relationship(
+        "ConversationSummary",
+        back_populates="conversation",
+        cascade="all, delete-orphan",
+    )
 
 
 class Message(Base, TimestampMixin):
     __tablename__ = "messages"
+    # 会話ごとの履歴を (created_at, id) 順にページングするため
+    __table_args__ = (
+        Index(
+            "ix_messages_conversation_id_created_at_id",
+            "conversation_id",
+            "created_at",
+            "id",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
     role: Mapped[str] = mapped_column(String, nullable=False)  # TODO: Enum
@@ -86,6 +104,24 @@ class Message(Base, TimestampMixin):
     )
 
 
+class ConversationSummary(Base, TimestampMixin):
+    __tablename__ = "conversation_summaries"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    conversation_id: Mapped[int] = mapped_column(
+        BigInteger,
+        ForeignKey("conversations.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    summary: Mapped[str] = mapped_column(String, nullable=False)
+    # 要約に含めた最後のメッセージのID
+    summarized_until_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    conversation: Mapped["Conversation"] = relationship(
+        "Conversation", back_populates="summary"
+    )
+
+
 class CurrentSkill(Base, TimestampMixin):
     __tablename__ = "current_skills"
 
@@ -94,6 +130,7 @@ class CurrentSkill(Base, TimestampMixin):
         BigInteger,
         ForeignKey("current_profiles.id", ondelete="CASCADE"),
         nullable=False,
+        index=True,
     )
     skill: Mapped[str] = mapped_column(String, nullable=False)
     current_profile: Mapped["CurrentProfile"] = relationship(
@@ -106,7 +143,10 @@ class FutureSkill(Base, TimestampMixin):
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
     future_profile_id: Mapped[int] = mapped_column(
-        BigInteger, ForeignKey("future_profiles.id", ondelete="CASCADE"), nullable=False
+        BigInteger,
+        ForeignKey("future_profiles.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
     skill: Mapped[str] = mapped_column(String, nullable=False)
     future_profile: Mapped["FutureProfile"] = relationship(
@@ -122,8 +162,49 @@ class FutureGoal(Base, TimestampMixin):
         BigInteger,
         ForeignKey("current_profiles.id", ondelete="CASCADE"),
         nullable=False,
+        index=True,
     )
     goal: Mapped[str] = mapped_column(String, nullable=False)
     current_profile: Mapped["CurrentProfile"] = relationship(
         "CurrentProfile", back_populates="future_goals"
     )
+
+
+class ConversationJob(Base, TimestampMixin):
+    __tablename__ = "conversation_jobs"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String, nullable=False)  # Firebase uid
+    current_profile_id: Mapped[int] = mapped_column(
+        BigInteger,
+        ForeignKey("current_profiles.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    status: Mapped[str] = mapped_column(String, nullable=False)  # TODO: Enum
+    stage: Mapped[str | None] = mapped_column(String, nullable=True)
+    conversation_id: Mapped[int | None] = mapped_column(
+        BigInteger, ForeignKey("conversations.id", ondelete="SET NULL"), nullable=True
+    )
+    error: Mapped[str | None] = mapped_column(String, nullable=True)
+    current_profile: Mapped["CurrentProfile"] = relationship("CurrentProfile")
+    conversation: Mapped["Conversation | None"] = relationship("Conversation")
+
+
+class IconCacheEntry(Base, TimestampMixin):
+    __tablename__ = "icon_cache_entries"
+    __table_args__ = (UniqueConstraint("summary_key", "prompt_version", "variant"),)
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    summary_key: Mapped[str] = mapped_column(String, nullable=False)  # 正規化済み
+    prompt_version: Mapped[str] = mapped_column(String, nullable=False)
+    variant: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    icon_hash: Mapped[str] = mapped_column(String(64), nullable=False)  # SHA-256
+
+
+class LLMCacheEntry(Base, TimestampMixin):
+    __tablename__ = "llm_cache_entries"
+    # 期限切れ・件数超過のエントリを古い順に削除するため
+    __table_args__ = (Index("ix_llm_cache_entries_created_at", "created_at"),)
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # SHA-256
+    value: Mapped[str] = mapped_column(String, nullable=False)  # LangChain の dumps
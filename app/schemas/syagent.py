@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Literal
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, computed_field
 
 
 class OutputConversation(BaseModel):
@@ -9,7 +9,31 @@ class OutputConversation(BaseModel):
 
     id: int = Field(..., description="会話のID")
     title: str = Field(..., description="会話のタイトル")
-    icon: str = Field(..., description="会話のアイコン")
+    icon_hash: str = Field(..., description="会話のアイコンのハッシュ値")
+    created_at: datetime = Field(..., description="作成日時")
+    updated_at: datetime = Field(..., description="更新日時")
+    model_config = ConfigDict(from_attributes=True)
+
+    @computed_field(description="会話のアイコンのURL")
+    @property
+    def icon_url(self) -> str:
+        return f"/api/icons/{self.icon_hash}"
+
+
+class OutputJob(BaseModel):
+    """会話作成ジョブの情報"""
+
+    id: int = Field(..., description="ジョブのID")
+    status: Literal["queued", "running", "succeeded", "failed"] = Field(
+        ..., description="ジョブの状態"
+    )
+    stage: Literal["simulating", "generating_icon", "saving"] | None = Field(
+        None, description="実行中の処理段階"
+    )
+    conversation: OutputConversation | None = Field(
+        None, description="作成された会話（成功時のみ）"
+    )
+    error: str | None = Field(None, description="失敗時のエラー内容")
     created_at: datetime = Field(..., description="作成日時")
     updated_at: datetime = Field(..., description="更新日時")
     model_config = ConfigDict(from_attributes=True)
@@ -34,6 +58,21 @@ class OutputMessage(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class StreamChunk(BaseModel):
+    """ストリーミング中に送信するチャンク"""
+
+    seq: int = Field(..., description="チャンクの連番（0始まり）")
+    content: str = Field(..., description="チャンクの内容")
+
+
+class StreamEnd(BaseModel):
+    """ストリーミング終了時に送信する情報"""
+
+    message_id: int = Field(..., description="保存したエージェントのメッセージのID")
+    user_message_id: int = Field(..., description="保存したユーザのメッセージのID")
+    chunks: int = Field(..., description="送信したチャンクの総数")
+
+
 class RoleMessage(BaseModel):
     """役割付きメッセージ"""
 
@@ -94,3 +133,36 @@ class ChatState(BaseModel):
     future_prof: FutureProfile = Field(
         ..., description="シミュレートした将来のプロフィール情報"
     )
+    current_prof_text: str | None = Field(
+        default=None, description="描画済みの現在のプロフィール（省略時は都度描画する）"
+    )
+    future_prof_text: str | None = Field(
+        default=None, description="描画済みの将来のプロフィール（省略時は都度描画する）"
+    )
+    summary: str = Field(default="", description="履歴に含まれない古い会話の要約")
+
+
+class ConversationContext(BaseModel):
+    """チャットに必要な会話の情報"""
+
+    conversation_id: int = Field(..., description="会話のID")
+    current_prof: CurrentProfile = Field(
+        ..., description="ユーザーの現在のプロフィール情報"
+    )
+    future_prof: FutureProfile = Field(
+        ..., description="シミュレートした将来のプロフィール情報"
+    )
+    current_prof_text: str = Field(..., description="current_prof.to_str() の結果")
+    future_prof_text: str = Field(..., description="future_prof.to_str() の結果")
+    summary: str = Field(default="", description="履歴に含まれない古い会話の要約")
+    history: list[RoleMessage] = Field(..., description="直近のチャット履歴")
+
+    def to_chat_state(self, user_input: str) -> ChatState:
+        return ChatState(
+            messages=self.history + [RoleMessage(role="user", content=user_input)],
+            current_prof=self.current_prof,
+            future_prof=self.future_prof,
+            current_prof_text=self.current_prof_text,
+            future_prof_text=self.future_prof_text,
+            summary=self.summary,
+        )
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class CacheStats(BaseModel):
+    """プロセス内キャッシュの統計情報"""
+
+    name: str = Field(..., description="キャッシュの名前")
+    size: int = Field(..., description="現在のエントリ数")
+    maxsize: int = Field(..., description="最大エントリ数")
+    hits: int = Field(..., description="ヒット数")
+    misses: int = Field(..., description="ミス数")
+    evictions: int = Field(..., description="容量超過により削除したエントリ数")
+    expirations: int = Field(..., description="失効により削除したエントリ数")
+    model_config = ConfigDict(from_attributes=True)
+
+
+class Readiness(BaseModel):
+    """起動時の準備の状態"""
+
+    ready: bool = Field(..., description="リクエストを受け付けられるかどうか")
+    components: dict[str, bool] = Field(
+        ..., description="準備の対象ごとの、準備に成功したかどうか"
+    )
+
+
+class PoolStats(BaseModel):
+    """DB の接続プールの統計情報"""
+
+    name: str = Field(..., description="接続先の名前（primary または replica-N）")
+    size: int = Field(..., description="プールが保持する接続数の上限")
+    checked_out: int = Field(..., description="使用中の接続数")
+    checked_in: int = Field(..., description="プール内で待機している接続数")
+    overflow: int = Field(..., description="上限を超えて作成された接続数")
+    checkouts: int = Field(..., description="接続を取得した回数")
+    timeouts: int = Field(..., description="接続の取得がタイムアウトした回数")
+    wait_seconds_total: float = Field(..., description="接続の取得の待ち時間の合計")
+    wait_seconds_max: float = Field(..., description="接続の取得の待ち時間の最大値")
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProfileSummary(BaseModel):
+    """保存されているリクエストのプロファイル"""
+
+    id: str = Field(..., description="プロファイルの ID（X-Profile-Id ヘッダの値）")
+    method: str = Field(..., description="HTTP メソッド")
+    path: str = Field(..., description="リクエストのパス")
+    route: str = Field(..., description="マッチしたルートのテンプレート")
+    status: int | None = Field(None, description="レスポンスのステータスコード")
+    started_at: datetime = Field(..., description="リクエストの開始時刻")
+    duration_seconds: float | None = Field(
+        None, description="レスポンスの送信完了までの秒数"
+    )
+    samples: int = Field(..., description="サンプル数")
+    model_config = ConfigDict(from_attributes=True)
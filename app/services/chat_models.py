@@ -0,0 +1,208 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Mapping, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, BaseMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from pydantic import ConfigDict
+
+from app.services.llm_hedging import HedgePolicy
+from app.services.resilience import TRANSIENT_ERRORS, Resilience
+
+# 最初のチャンク（空の応答の場合は None）と、残りのチャンクのストリーム
+OpenedStream = tuple[BaseMessageChunk | None, AsyncIterator[BaseMessageChunk]]
+
+
+class WrappedChatModel(BaseChatModel, ABC):
+    """
+    他のチャットモデルの呼び出しを仲介するモデルの基底クラス。
+    ツールの形式への変換とキャッシュのキーに使う識別情報は primary に任せる。
+    内側のモデルのコールバックは呼ばず、このモデルの呼び出しとして扱う。
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    @abstractmethod
+    def primary(self) -> BaseChatModel: ...
+
+    @property
+    def _llm_type(self) -> str:
+        return self.primary._llm_type
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return self.primary._identifying_params
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        # 変換したツールは呼び出し時の引数として内側のモデルに渡る
+        bound = self.primary.bind_tools(tools, **kwargs)
+        return self.bind(**getattr(bound, "kwargs", {}))
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self.primary.invoke(
+            messages, config={"callbacks": []}, stop=stop, **kwargs
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    @staticmethod
+    async def _invoke(
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        stop: list[str] | None,
+        kwargs: dict[str, Any],
+    ) -> BaseMessage:
+        return await model.ainvoke(
+            messages, config={"callbacks": []}, stop=stop, **kwargs
+        )
+
+    @staticmethod
+    async def _open_stream(
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        stop: list[str] | None,
+        kwargs: dict[str, Any],
+    ) -> OpenedStream:
+        """
+        ストリームを開始し、最初のチャンクが届くまで待つ。
+        """
+        stream = model.astream(messages, config={"callbacks": []}, stop=stop, **kwargs)
+        try:
+            return await anext(stream, None), stream
+        except BaseException:
+            await stream.aclose()  # type: ignore[attr-defined]
+            raise
+
+    @staticmethod
+    async def _close_stream(opened: OpenedStream) -> None:
+        await opened[1].aclose()  # type: ignore[attr-defined]
+
+    async def _relay(
+        self,
+        opened: OpenedStream,
+        run_manager: AsyncCallbackManagerForLLMRun | None,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        first, stream = opened
+        try:
+            if first is None:
+                return
+            yield await self._emit(first, run_manager)
+            async for message in stream:
+                yield await self._emit(message, run_manager)
+        finally:
+            await self._close_stream(opened)
+
+    @staticmethod
+    async def _emit(
+        message: BaseMessageChunk, run_manager: AsyncCallbackManagerForLLMRun | None
+    ) -> ChatGenerationChunk:
+        chunk = ChatGenerationChunk(message=message)
+        if run_manager:
+            await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+        return chunk
+
+
+class HedgedChatModel(WrappedChatModel):
+    """
+    HedgePolicy に従って、models の先頭から順にリクエストを送るチャットモデル。
+    ストリーミングでは最初のチャンクが届くまでを、それ以外では応答全体を競わせる。
+    """
+
+    models: Sequence[BaseChatModel]
+    policy: HedgePolicy
+
+    @property
+    def primary(self) -> BaseChatModel:
+        return self.models[0]
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = await self.policy.race(
+            [
+                lambda model=model: self._invoke(model, messages, stop, kwargs)
+                for model in self._candidates()
+            ]
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        opened = await self.policy.race(
+            [
+                lambda model=model: self._open_stream(model, messages, stop, kwargs)
+                for model in self._candidates()
+            ],
+            discard=self._close_stream,
+        )
+        async for chunk in self._relay(opened, run_manager):
+            yield chunk
+
+    def _candidates(self) -> list[BaseChatModel]:
+        # 追加のモデルがない場合は、同じモデルにもう一度送る
+        models = list(self.models)
+        return models if len(models) > 1 else models * 2
+
+
+class ResilientChatModel(WrappedChatModel):
+    """
+    model の呼び出しに Resilience（タイムアウト、回路遮断、リトライ）を適用する。
+    ストリーミングでは、最初のチャンクが届くまでをリトライの対象にする。
+    """
+
+    model: BaseChatModel
+    resilience: Resilience
+
+    @property
+    def primary(self) -> BaseChatModel:
+        return self.model
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = await self.resilience.call(
+            lambda: self._invoke(self.model, messages, stop, kwargs)
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        opened = await self.resilience.call(
+            lambda: self._open_stream(self.model, messages, stop, kwargs)
+        )
+        try:
+            async for chunk in self._relay(opened, run_manager):
+                yield chunk
+        except TRANSIENT_ERRORS:
+            # 途中で切れた場合はリトライできないが、回路の判断には含める
+            self.resilience.breaker.record_failure()
+            raise
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[int], Awaitable[None]]
+
+
+class JobQueue(ABC):
+    """
+    ジョブキューのインターフェース。
+    ジョブの状態は DB のテーブルに記録し、キューはジョブIDのみを受け渡す。
+    """
+
+    @abstractmethod
+    async def start(self) -> None: ...
+
+    @abstractmethod
+    async def stop(self) -> None: ...
+
+    @abstractmethod
+    async def enqueue(self, job_id: int) -> None: ...
+
+
+class InProcessJobQueue(JobQueue):
+    """
+    プロセス内の asyncio タスクでジョブを処理するキュー。
+    プロセスが停止した場合、未完了のジョブは起動時に DB から再投入する。
+    """
+
+    def __init__(self, handler: JobHandler, workers: int = 2):
+        self.handler = handler
+        self.workers = workers
+        self.queue: asyncio.Queue[int] = asyncio.Queue()
+        self.tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self.tasks = [
+            asyncio.create_task(self._work(), name=f"job-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def enqueue(self, job_id: int) -> None:
+        await self.queue.put(job_id)
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self.handler(job_id)
+            except Exception:
+                logger.exception("job %s failed", job_id)
+            finally:
+                self.queue.task_done()
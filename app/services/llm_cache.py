@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+import warnings
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+
+class LLMCacheStore(ABC):
+    """
+    LLM の応答をキーと文字列の組で保存するストア。
+    ttl_seconds を過ぎたエントリは返さず、max_entries を超えた分は古い順に削除する。
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    @abstractmethod
+    async def get(self, key: str) -> str | None: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str) -> None: ...
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+
+class SQLiteLLMCacheStore(LLMCacheStore):
+    """
+    ローカルの SQLite ファイルに保存するストア。
+    """
+
+    def __init__(self, path: str | Path, ttl_seconds: int, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_llm_cache_created_at "
+                "ON llm_cache (created_at)"
+            )
+            self._conn = conn
+        return self._conn
+
+    async def get(self, key: str) -> str | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str) -> None:
+        await asyncio.to_thread(self._set, key, value)
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._clear)
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT value FROM llm_cache WHERE key = ? AND created_at >= ?",
+                    (key, time.time() - self.ttl_seconds),
+                )
+                .fetchone()
+            )
+        return row[0] if row else None
+
+    def _set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) "
+                "VALUES (?, ?, ?)",
+                (key, value, now),
+            )
+            conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache "
+                "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def _clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+
+class LLMCache(BaseCache):
+    """
+    LangChain のチャットモデルに渡す完全一致キャッシュ。
+    キーはモデルの設定（llm_string）、namespace（プロンプトのバージョン）、
+    空白と Unicode を正規化したプロンプトから作る。
+    ストアが設定されていない間は何もキャッシュしない。
+    非同期 API（ainvoke など）のみに対応し、同期呼び出しでは常にキャッシュを使わない。
+    """
+
+    def __init__(self, namespace: str, store: LLMCacheStore | None = None):
+        self.namespace = namespace
+        self.store = store
+
+    def key_for(self, prompt: str, llm_string: str) -> str:
+        # チャットモデルのプロンプトはメッセージのリストを JSON にしたもの
+        try:
+            normalized = _normalize(json.loads(prompt))
+        except json.JSONDecodeError:
+            normalized = _normalize(prompt)
+        raw = json.dumps(
+            [self.namespace, llm_string, normalized], ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        pass
+
+    def clear(self, **kwargs: Any) -> None:
+        pass
+
+    async def alookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        if self.store is None:
+            return None
+        value = await self.store.get(self.key_for(prompt, llm_string))
+        if value is None:
+            return None
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", LangChainBetaWarning)
+            return loads(value)
+
+    async def aupdate(
+        self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE
+    ) -> None:
+        if self.store is None:
+            return
+        await self.store.set(self.key_for(prompt, llm_string), dumps(return_val))
+
+    async def aclear(self, **kwargs: Any) -> None:
+        if self.store is not None:
+            await self.store.clear()
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(unicodedata.normalize("NFKC", value).split())
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    return value
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from app.core.metrics import Counter
+
+T = TypeVar("T")
+
+hedges_fired = Counter(
+    "llm_hedges_total",
+    "応答が遅いか失敗したために送った追加のリクエスト数",
+    ("chain", "reason"),
+)
+hedged_wins = Counter(
+    "llm_hedged_wins_total",
+    "追加のリクエストを送った呼び出しで、どちらの応答を使ったか",
+    ("chain", "winner"),
+)
+
+
+class HedgePolicy:
+    """
+    最初の応答が、直近の応答時間の percentile 分位点までに届かなければ、
+    次の候補にもリクエストを送り、先に応答した方を使う（負けた方はキャンセルする）。
+    応答数が window の半分に満たない間は initial_deadline を待ち時間に使う。
+    """
+
+    def __init__(
+        self,
+        chain: str,
+        percentile: float,
+        window: int,
+        initial_deadline: float,
+        min_deadline: float,
+    ):
+        self.chain = chain
+        self.percentile = percentile
+        self.initial_deadline = initial_deadline
+        self.min_deadline = min_deadline
+        self._latencies: deque[float] = deque(maxlen=window)
+
+    def deadline(self) -> float:
+        latencies = self._latencies
+        if len(latencies) < (latencies.maxlen or 0) // 2:
+            return self.initial_deadline
+        ordered = sorted(latencies)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return max(ordered[index], self.min_deadline)
+
+    async def race(
+        self,
+        attempts: list[Callable[[], Awaitable[T]]],
+        discard: Callable[[T], Awaitable[None]] | None = None,
+    ) -> T:
+        """
+        attempts[0] を実行し、deadline を過ぎるか失敗するごとに次の attempt を追加で
+        実行する。最初に成功した結果を返し、残りはキャンセルする。
+        同時に成功した結果のうち使わなかったものは discard に渡す。
+        """
+        start = time.perf_counter()
+        deadline = self.deadline()
+        pending: dict[asyncio.Task[T], int] = {}
+        next_attempt = 0
+        error: BaseException | None = None
+
+        def fire(reason: str | None) -> None:
+            nonlocal next_attempt
+            if reason is not None:
+                hedges_fired.inc(chain=self.chain, reason=reason)
+            pending[asyncio.ensure_future(attempts[next_attempt]())] = next_attempt
+            next_attempt += 1
+
+        fire(None)
+        try:
+            while pending:
+                can_hedge = next_attempt < len(attempts)
+                timeout = None
+                if can_hedge:
+                    elapsed = time.perf_counter() - start
+                    timeout = max(deadline * next_attempt - elapsed, 0)
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    fire("deadline")
+                    continue
+                winner: asyncio.Task[T] | None = None
+                winner_index = 0
+                for task in done:
+                    index = pending.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+                        winner_index = index
+                    elif discard is not None:
+                        await discard(task.result())
+                if winner is not None:
+                    # ヘッジで勝った場合も、最初のリクエストがそれまでに要した時間を
+                    # 記録し、分位点が実際より短くならないようにする
+                    self._latencies.append(time.perf_counter() - start)
+                    if next_attempt > 1:
+                        hedged_wins.inc(
+                            chain=self.chain,
+                            winner="primary" if winner_index == 0 else "hedge",
+                        )
+                    return winner.result()
+                if not pending and can_hedge:
+                    fire("error")
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,244 @@
+import asyncio
+import math
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from functools import cache
+from typing import Any, AsyncIterator, Literal
+
+from langchain_core.language_models import BaseChatModel
+
+from app.core.config import setting
+from app.core.metrics import Counter, Gauge, Histogram
+from app.services.chat_models import HedgedChatModel, ResilientChatModel
+from app.services.llm_hedging import HedgePolicy
+from app.services.resilience import CircuitOpen, Resilience, create_resilience
+
+queue_depth = Gauge(
+    "llm_queue_depth", "LLM の実行枠を待っているリクエスト数", ("model",)
+)
+in_flight = Gauge("llm_in_flight", "LLM の実行枠を使用中のリクエスト数", ("model",))
+queue_wait_time = Histogram(
+    "llm_queue_wait_seconds", "LLM の実行枠を得るまでの待ち時間", ("model",)
+)
+rejections = Counter(
+    "llm_rejections_total",
+    "LLM の実行枠を得られずに拒否したリクエスト数",
+    ("model", "reason"),
+)
+
+
+class LLMOverloaded(Exception):
+    """
+    LLM の実行枠を得られなかった。
+    queue_full は待ち行列が一杯で即座に、timeout は待ち時間の上限に達して拒否した。
+    """
+
+    def __init__(
+        self, model: str, reason: Literal["queue_full", "timeout"], retry_after: int
+    ):
+        super().__init__(f"{model} is overloaded ({reason})")
+        self.model = model
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Permit:
+    """
+    ConcurrencyLimiter の実行枠。使い終わったら release する。
+    """
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self._limiter = limiter
+        self._start = time.perf_counter()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._limiter._release(time.perf_counter() - self._start)
+
+
+class ConcurrencyLimiter:
+    """
+    モデルごとの同時実行数を制限する。
+    上限に達している場合は到着順に待たせ、待ち行列が一杯の場合や timeout 秒以内に
+    実行できない場合は LLMOverloaded を送出する。
+    """
+
+    def __init__(
+        self, model: str, max_concurrency: int, max_queue: int, timeout: float
+    ):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        # 1件あたりの実行時間の指数移動平均。Retry-After の見積もりに使う
+        self._hold_seconds = 1.0
+
+    async def acquire(self, block: bool = False) -> Permit:
+        """
+        実行枠を取得する。
+        block が True の場合は待ち行列の上限と待ち時間の上限を無視して待つ
+        （バックグラウンドの処理など、拒否しても再試行されないもの向け）。
+        """
+        if not block and self._semaphore.locked() and self._waiting >= self.max_queue:
+            rejections.inc(model=self.model, reason="queue_full")
+            raise LLMOverloaded(self.model, "queue_full", self.retry_after())
+
+        self._waiting += 1
+        queue_depth.inc(model=self.model)
+        start = time.perf_counter()
+        try:
+            if block:
+                await self._semaphore.acquire()
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except TimeoutError:
+            rejections.inc(model=self.model, reason="timeout")
+            raise LLMOverloaded(self.model, "timeout", self.retry_after()) from None
+        finally:
+            self._waiting -= 1
+            queue_depth.dec(model=self.model)
+            queue_wait_time.observe(time.perf_counter() - start, model=self.model)
+        in_flight.inc(model=self.model)
+        return Permit(self)
+
+    @asynccontextmanager
+    async def slot(self, block: bool = False) -> AsyncIterator[None]:
+        permit = await self.acquire(block)
+        try:
+            yield
+        finally:
+            permit.release()
+
+    def retry_after(self) -> int:
+        """
+        待っているリクエストが捌けるまでの秒数の見積もり。
+        """
+        rounds = self._waiting / self.max_concurrency + 1
+        return max(1, math.ceil(self._hold_seconds * rounds))
+
+    def _release(self, held_seconds: float) -> None:
+        self._semaphore.release()
+        in_flight.dec(model=self.model)
+        self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held_seconds
+
+
+class LLMProvider(ABC):
+    """
+    チャットモデルの生成と、モデルごとの同時実行数の制限・回路遮断を担う。
+    同じモデルを使う処理は、API のクォータを共有するため同じ制限を受ける。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        fallback_models: list[str] | None = None,
+        hedge_policies: dict[str, HedgePolicy] | None = None,
+        request_timeout: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.fallback_models = fallback_models or []
+        self.hedge_policies = hedge_policies or {}
+        self.request_timeout = request_timeout
+        self._limiters: dict[str, ConcurrencyLimiter] = {}
+        self._resiliences: dict[str, Resilience] = {}
+
+    def chat_model(
+        self, model: str, chain: str | None = None, **kwargs: Any
+    ) -> BaseChatModel:
+        """
+        モデルごとの Resilience を適用したモデルを返す。
+        chain にヘッジの設定があれば、応答が遅い場合に fallback_models
+        （なければ同じモデル）にもリクエストを送るモデルを返す。
+        kwargs（cache など）は最も外側のモデルに渡す。
+        """
+        policy = self.hedge_policies.get(chain) if chain else None
+        if policy is None:
+            return ResilientChatModel(
+                model=self._create(model),
+                resilience=self.resilience(model),
+                **kwargs,
+            )
+        models = [
+            ResilientChatModel(
+                model=self._create(name), resilience=self.resilience(name)
+            )
+            for name in self._candidates(model, chain)
+        ]
+        return HedgedChatModel(models=models, policy=policy, **kwargs)
+
+    def check_available(self, model: str, chain: str | None = None) -> None:
+        """
+        chain で使うモデルの回路がすべて開いていれば CircuitOpen を送出する。
+        実行枠を確保する前に呼び、呼び出せないリクエストを待たせずに失敗させる。
+        """
+        breakers = [
+            self.resilience(name).breaker for name in self._candidates(model, chain)
+        ]
+        if all(breaker.is_open for breaker in breakers):
+            raise CircuitOpen(model, min(breaker.retry_after() for breaker in breakers))
+
+    @abstractmethod
+    def _create(self, model: str) -> BaseChatModel: ...
+
+    def _candidates(self, model: str, chain: str | None) -> list[str]:
+        if chain in self.hedge_policies:
+            return [model, *self.fallback_models]
+        return [model]
+
+    def limiter(self, model: str) -> ConcurrencyLimiter:
+        if model not in self._limiters:
+            self._limiters[model] = ConcurrencyLimiter(
+                model, self.max_concurrency, self.max_queue, self.queue_timeout
+            )
+        return self._limiters[model]
+
+    def resilience(self, model: str) -> Resilience:
+        if model not in self._resiliences:
+            self._resiliences[model] = create_resilience(model, self.request_timeout)
+        return self._resiliences[model]
+
+
+class VertexAIProvider(LLMProvider):
+    def _create(self, model: str) -> BaseChatModel:
+        # langchain_google_vertexai の import は重いため、最初に生成する時に行う
+        from langchain_google_vertexai import ChatVertexAI
+
+        # リトライは Resilience で予算の範囲内で行うため、SDK 側では行わない
+        return ChatVertexAI(model=model, max_retries=0)
+
+
+@cache
+def get_llm_provider() -> LLMProvider:
+    match setting.llm_provider:
+        case "vertexai":
+            return VertexAIProvider(
+                max_concurrency=setting.llm_max_concurrency,
+                max_queue=setting.llm_max_queue,
+                queue_timeout=setting.llm_queue_timeout_seconds,
+                fallback_models=setting.llm_fallback_models,
+                hedge_policies=_hedge_policies(),
+                request_timeout=setting.llm_request_timeout_seconds,
+            )
+
+
+def _hedge_policies() -> dict[str, HedgePolicy]:
+    return {
+        chain: HedgePolicy(
+            chain,
+            percentile,
+            window=setting.llm_hedge_window,
+            initial_deadline=setting.llm_hedge_initial_deadline_seconds,
+            min_deadline=setting.llm_hedge_min_deadline_seconds,
+        )
+        for chain, percentile in setting.llm_hedge_percentiles.items()
+    }
@@ -0,0 +1,213 @@
+import asyncio
+import math
+import random
+import time
+from typing import Awaitable, Callable, Literal, TypeVar
+
+from google.api_core import exceptions as google_exceptions
+
+from app.core.config import setting
+from app.core.metrics import Counter, Gauge
+
+T = TypeVar("T")
+
+# 時間をおけば成功しうるエラー。リトライの対象とし、回路を開く失敗として数える
+TRANSIENT_ERRORS: tuple[type[BaseException], ...] = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    TimeoutError,
+    ConnectionError,
+)
+
+circuit_state = Gauge(
+    "circuit_state",
+    "外部サービスの呼び出しの回路の状態（0: closed, 1: half-open, 2: open）",
+    ("endpoint",),
+)
+circuit_rejections = Counter(
+    "circuit_rejections_total",
+    "回路が開いていたために失敗させた呼び出しの数",
+    ("endpoint",),
+)
+retries = Counter(
+    "upstream_retries_total", "外部サービスの呼び出しをリトライした回数", ("endpoint",)
+)
+
+
+class CircuitOpen(Exception):
+    """
+    回路が開いているため、外部サービスを呼び出さずに失敗させた。
+    """
+
+    def __init__(self, endpoint: str, retry_after: int):
+        super().__init__(f"{endpoint} is unavailable")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    連続して failure_threshold 回失敗したら回路を開き、reset_timeout 秒の間は
+    呼び出さずに CircuitOpen を送出する。
+    その後は1件だけ試しに呼び出し（half-open）、成功すれば閉じ、失敗すれば再び開く。
+    """
+
+    def __init__(self, endpoint: str, failure_threshold: int, reset_timeout: float):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state: Literal["closed", "half_open", "open"] = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._set_state("closed")
+
+    @property
+    def is_open(self) -> bool:
+        """
+        呼び出しても CircuitOpen になる状態かどうか。
+        """
+        if self.state == "open":
+            return time.monotonic() - self._opened_at < self.reset_timeout
+        return self.state == "half_open" and self._probing
+
+    def retry_after(self) -> int:
+        remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        return max(1, math.ceil(remaining))
+
+    def before_call(self) -> None:
+        if self.is_open:
+            circuit_rejections.inc(endpoint=self.endpoint)
+            raise CircuitOpen(self.endpoint, self.retry_after())
+        if self.state == "open":
+            self._set_state("half_open")
+        if self.state == "half_open":
+            self._probing = True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probing = False
+        self._set_state("closed")
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state("open")
+
+    def release(self) -> None:
+        """
+        結果が分からないまま呼び出しを終えた（キャンセルされた）場合に呼ぶ。
+        """
+        self._probing = False
+
+    def _set_state(self, state: Literal["closed", "half_open", "open"]) -> None:
+        self.state = state
+        value = {"closed": 0, "half_open": 1, "open": 2}[state]
+        circuit_state.set(value, endpoint=self.endpoint)
+
+
+class RetryBudget:
+    """
+    リクエスト1件ごとに ratio ずつ貯まり、リトライ1回ごとに1使うトークンバケット。
+    障害時にリトライで負荷が何倍にも増えないよう、リトライの割合を抑える。
+    """
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    def deposit(self) -> None:
+        self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class Resilience:
+    """
+    外部サービスの呼び出しに、タイムアウト、回路遮断、指数バックオフ（full jitter）
+    によるリトライを適用する。リトライは TRANSIENT_ERRORS のみを対象とし、
+    回数は max_attempts と RetryBudget の両方で制限する。
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        breaker: CircuitBreaker,
+        budget: RetryBudget,
+        timeout: float,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+    ):
+        self.endpoint = endpoint
+        self.breaker = breaker
+        self.budget = budget
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def call(
+        self, fn: Callable[[], Awaitable[T]], retry_timeouts: bool = True
+    ) -> T:
+        """
+        fn の呼び出しを Resilience の制御下で行う。
+        スレッドで実行する同期 API のように、タイムアウトしても処理が止まらない場合は
+        retry_timeouts を False にし、止まっていない呼び出しに重ねてリトライしない。
+        """
+        self.budget.deposit()
+        attempt = 1
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await asyncio.wait_for(fn(), self.timeout)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except TRANSIENT_ERRORS as e:
+                self.breaker.record_failure()
+                if (
+                    attempt >= self.max_attempts
+                    or (isinstance(e, TimeoutError) and not retry_timeouts)
+                    or not self.budget.withdraw()
+                ):
+                    raise
+            except Exception:
+                # 外部サービスは応答しているため、回路の判断には成功として扱う
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            retries.inc(endpoint=self.endpoint)
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            await asyncio.sleep(random.uniform(0, delay))
+            attempt += 1
+
+
+def create_resilience(endpoint: str, timeout: float) -> Resilience:
+    return Resilience(
+        endpoint,
+        CircuitBreaker(
+            endpoint,
+            failure_threshold=setting.circuit_failure_threshold,
+            reset_timeout=setting.circuit_reset_seconds,
+        ),
+        RetryBudget(setting.retry_budget_ratio),
+        timeout=timeout,
+        max_attempts=setting.retry_max_attempts,
+        base_delay=setting.retry_base_delay_seconds,
+        max_delay=setting.retry_max_delay_seconds,
+    )
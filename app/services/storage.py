@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from functools import cache
+from pathlib import Path
+
+from app.core.config import setting
+
+
+class BlobStore(ABC):
+    """
+    内容のハッシュ値（SHA-256）をキーとしてバイナリを保存するストア。
+    同じ内容は一度だけ保存される。
+    """
+
+    @staticmethod
+    def key_for(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @abstractmethod
+    async def put(self, data: bytes) -> str: ...
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None: ...
+
+
+class LocalBlobStore(BlobStore):
+    """
+    ローカルファイルシステムに保存するストア。
+    キーの先頭2文字をディレクトリ名にして、1ディレクトリ内のファイル数を抑える。
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    async def put(self, data: bytes) -> str:
+        key = self.key_for(data)
+        await asyncio.to_thread(self._write, key, data)
+        return key
+
+    async def get(self, key: str) -> bytes | None:
+        return await asyncio.to_thread(self._read, key)
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 書き込み途中のファイルが読まれないよう、一時ファイルから置き換える
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _read(self, key: str) -> bytes | None:
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+
+@cache
+def get_icon_store() -> BlobStore:
+    match setting.icon_store_backend:
+        case "local":
+            return LocalBlobStore(setting.icon_store_path)
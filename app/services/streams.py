@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from functools import cache
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable
+
+from app.core.config import setting
+from app.core.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+streams_buffered = Gauge(
+    "resumable_streams_buffered", "バッファに保持しているストリームの数"
+)
+stream_outcomes = Counter(
+    "resumable_streams_total",
+    "生成を終えたストリームの数（completed, failed, abandoned）",
+    ("outcome",),
+)
+stream_resumes = Counter(
+    "resumable_stream_resumes_total", "途中から読み直されたストリームの数"
+)
+
+# 読み手がいなくなったストリームを確認する間隔
+_WATCH_INTERVAL = 0.5
+
+_generations: set[asyncio.Task] = set()
+
+
+class StreamNotFound(Exception):
+    """
+    ストリームが存在しないか、完了後の猶予期間が過ぎて削除された。
+    """
+
+
+class StreamOffsetExpired(Exception):
+    """
+    指定した位置のイベントは、リングバッファから既に押し出されている。
+    """
+
+
+@dataclass
+class StreamEvent:
+    offset: int
+    event: str
+    data: str
+
+
+class StreamStore(ABC):
+    """
+    生成中の応答のイベントを、クライアントの接続とは独立に保持するストア。
+    各ストリームは直近の一定数のイベントのみを保持し、完了後は猶予期間の後に削除する。
+    複数のインスタンスで共有する場合は、共有ストレージを使う実装に差し替える。
+    """
+
+    @abstractmethod
+    async def create(self, stream_id: str) -> None: ...
+
+    @abstractmethod
+    async def append(self, stream_id: str, event: str, data: str) -> None: ...
+
+    @abstractmethod
+    async def complete(self, stream_id: str) -> None: ...
+
+    @abstractmethod
+    async def open(self, stream_id: str, offset: int) -> AsyncIterator[StreamEvent]:
+        """
+        offset 以降のイベントを、ストリームが完了するまで順に返すイテレータを返す。
+        ストリームがなければ StreamNotFound を、offset のイベントが既に押し出されて
+        いれば StreamOffsetExpired を、イテレータを返す前に送出する。
+        """
+
+    @abstractmethod
+    async def idle_seconds(self, stream_id: str) -> float:
+        """
+        ストリームを読んでいるクライアントがいなくなってからの秒数（いれば 0）。
+        """
+
+
+@dataclass(eq=False)
+class _Buffer:
+    events: deque[tuple[str, str]]
+    first_offset: int = 0
+    completed_at: float | None = None
+    readers: int = 0
+    detached_at: float = field(default_factory=time.monotonic)
+    changed: asyncio.Condition = field(default_factory=asyncio.Condition)
+
+    @property
+    def next_offset(self) -> int:
+        return self.first_offset + len(self.events)
+
+
+class InMemoryStreamStore(StreamStore):
+    """
+    プロセス内のリングバッファに保持するストア。
+    再接続が同じインスタンスに届く場合（単一インスタンスやセッションアフィニティ）に使う。
+    """
+
+    def __init__(self, max_events: int, grace_seconds: float):
+        self.max_events = max_events
+        self.grace_seconds = grace_seconds
+        self._buffers: dict[str, _Buffer] = {}
+
+    async def create(self, stream_id: str) -> None:
+        self._purge()
+        self._buffers[stream_id] = _Buffer(deque(maxlen=self.max_events))
+        streams_buffered.set(len(self._buffers))
+
+    async def append(self, stream_id: str, event: str, data: str) -> None:
+        buffer = self._buffers[stream_id]
+        if len(buffer.events) == self.max_events:
+            buffer.first_offset += 1
+        buffer.events.append((event, data))
+        async with buffer.changed:
+            buffer.changed.notify_all()
+
+    async def complete(self, stream_id: str) -> None:
+        buffer = self._buffers[stream_id]
+        buffer.completed_at = time.monotonic()
+        async with buffer.changed:
+            buffer.changed.notify_all()
+
+    async def open(self, stream_id: str, offset: int) -> AsyncIterator[StreamEvent]:
+        self._purge()
+        buffer = self._buffers.get(stream_id)
+        if buffer is None:
+            raise StreamNotFound(stream_id)
+        if offset < buffer.first_offset:
+            raise StreamOffsetExpired(stream_id)
+        return self._read(buffer, offset)
+
+    async def idle_seconds(self, stream_id: str) -> float:
+        buffer = self._buffers[stream_id]
+        if buffer.readers:
+            return 0.0
+        return time.monotonic() - buffer.detached_at
+
+    async def _read(self, buffer: _Buffer, offset: int) -> AsyncIterator[StreamEvent]:
+        buffer.readers += 1
+        try:
+            while True:
+                async with buffer.changed:
+                    await buffer.changed.wait_for(
+                        lambda offset=offset: (
+                            offset < buffer.next_offset
+                            or buffer.completed_at is not None
+                        )
+                    )
+                while offset < buffer.next_offset:
+                    # yield している間にも追加されるため、読むたびに確かめる
+                    if offset < buffer.first_offset:
+                        # 読むのが遅く、未読のイベントが押し出された
+                        raise StreamOffsetExpired()
+                    event, data = buffer.events[offset - buffer.first_offset]
+                    yield StreamEvent(offset, event, data)
+                    offset += 1
+                if buffer.completed_at is not None and offset >= buffer.next_offset:
+                    return
+        finally:
+            buffer.readers -= 1
+            if not buffer.readers:
+                buffer.detached_at = time.monotonic()
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for stream_id, buffer in list(self._buffers.items()):
+            if (
+                buffer.completed_at is not None
+                and now - buffer.completed_at > self.grace_seconds
+            ):
+                del self._buffers[stream_id]
+        streams_buffered.set(len(self._buffers))
+
+
+@cache
+def get_stream_store() -> StreamStore:
+    match setting.chat_stream_backend:
+        case "memory":
+            return InMemoryStreamStore(
+                setting.chat_stream_buffer_events, setting.chat_stream_grace_seconds
+            )
+
+
+async def start_stream(
+    store: StreamStore,
+    stream_id: str,
+    events: AsyncGenerator[tuple[str, str], None],
+    abandon_after: float,
+    on_complete: Callable[[], Awaitable[None]] | None = None,
+) -> None:
+    """
+    events（イベント名と JSON の組）を、クライアントの接続とは独立したタスクで読み、
+    store に書き込む。読み手が abandon_after 秒以上いなければ生成を中断する。
+    完了後に on_complete を呼ぶ。
+    """
+    await store.create(stream_id)
+    task = asyncio.create_task(
+        _generate(store, stream_id, events, abandon_after, on_complete),
+        name=f"stream-{stream_id}",
+    )
+    _generations.add(task)
+    task.add_done_callback(_generations.discard)
+
+
+async def stop_streams() -> None:
+    """
+    生成中のストリームを全て中断する（停止時に呼ぶ）。
+    """
+    for task in list(_generations):
+        task.cancel()
+    await asyncio.gather(*_generations, return_exceptions=True)
+
+
+async def _generate(
+    store: StreamStore,
+    stream_id: str,
+    events: AsyncGenerator[tuple[str, str], None],
+    abandon_after: float,
+    on_complete: Callable[[], Awaitable[None]] | None,
+) -> None:
+    async def consume() -> None:
+        # 中断された場合も events を閉じ、生成側の DB の接続や LLM の実行枠をすぐに戻す
+        async with aclosing(events):
+            async for event, data in events:
+                await store.append(stream_id, event, data)
+
+    consuming = asyncio.create_task(consume())
+    outcome = "completed"
+    try:
+        while not consuming.done():
+            await asyncio.wait({consuming}, timeout=_WATCH_INTERVAL)
+            if (
+                not consuming.done()
+                and await store.idle_seconds(stream_id) > abandon_after
+            ):
+                outcome = "abandoned"
+                consuming.cancel()
+                await asyncio.wait({consuming})
+        if not consuming.cancelled() and consuming.exception() is not None:
+            outcome = "failed"
+            logger.error("stream %s failed", stream_id, exc_info=consuming.exception())
+            await store.append(
+                stream_id, "error", '{"detail":"Failed to generate the response"}'
+            )
+    finally:
+        # 停止時に中断された場合も、生成側の後始末（途中の応答の保存など）を待つ
+        consuming.cancel()
+        await asyncio.wait({consuming})
+        stream_outcomes.inc(outcome=outcome)
+        await store.complete(stream_id)
+    if on_complete is not None and outcome == "completed":
+        try:
+            await on_complete()
+        except Exception:
+            logger.exception("post-processing of stream %s failed", stream_id)
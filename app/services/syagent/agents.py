@@ -1,11 +1,13 @@
 import asyncio
 
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from langchain_google_vertexai import ChatVertexAI
 from langgraph.graph.state import END, START, CompiledStateGraph, StateGraph
 from langgraph.prebuilt import ToolNode
 
+from app.core.metrics import Histogram
 from app.schemas.syagent import ChatState, CurrentProfile, FutureProfile, RoleMessage
 from app.services.syagent.components import (
     ChatGenerator,
@@ -15,27 +17,36 @@ from app.services.syagent.components import (
 from app.services.syagent.state import SimState
 from app.services.syagent.tools import CareerTool
 
+simulation_node_time = Histogram(
+    "simulation_node_seconds", "SimulationWorkflow の各ノードの実行時間", ("node",)
+)
+simulation_tool_iterations = Histogram(
+    "simulation_tool_iterations",
+    "SimulationWorkflow の1回の実行でツールを呼び出した回数",
+    buckets=(0, 1, 2, 3, 4, 5, 8, 10),
+)
+
 
 class SimulationWorkflow:
     """
     将来のアバターを作成するワークフロークラス。
     現在のユーザの情報から、将来の自己像を作成する。
+    グラフは生成時に一度だけコンパイルし、リクエスト間で使い回す。
     """
 
-    def __init__(self, model: ChatVertexAI, current_profile: CurrentProfile):
+    def __init__(self, model: BaseChatModel):
         self.model = model
         self.model_with_tools = self._define_tools(model)
         self.future_simulator = FutureSimulator(self.model_with_tools)
         self.prof_generator = ProfileGenerator(self.model)
 
         self.workflow = self._build_workflow()
-        self.current_prof = current_profile
 
-    def _define_tools(self, model: ChatVertexAI):
+    def _define_tools(self, model: BaseChatModel):
         career_tool = CareerTool(model)
 
         @tool
-        def design_career(
+        async def design_career(
             time_frame: int,
             current_age: int,
             current_status: str,
@@ -54,7 +65,7 @@ class SimulationWorkflow:
                 future_goals=future_goals,
                 extra="",
             )
-            response = career_tool.chain.invoke(
+            response = await career_tool.chain.ainvoke(
                 {"time_frame": time_frame, "current_prof": current_prof}
             )
             return f"具体的なキャリアパスの一つは以下です。\n{response.content}"
@@ -70,20 +81,20 @@ class SimulationWorkflow:
         return model.bind_tools(self.tools)
 
     def _build_workflow(self) -> CompiledStateGraph:
-        def call_model(state: SimState):
+        async def call_model(state: SimState):
             gathered_info = gathered_info = ", ".join(
                 str(msg.content)
                 for msg in state["messages"]
                 if isinstance(msg, ToolMessage)
             )
-            response = self.future_simulator.run(
-                self.time_frame, self.current_prof, gathered_info
+            response = await self.future_simulator.arun(
+                state["time_frame"], state["current_profile"], gathered_info
             )
             if response.tool_calls:
                 return {"messages": response}
             else:
-                profile = self.prof_generator.generate(
-                    self.time_frame, self.current_prof, gathered_info
+                profile = await self.prof_generator.agenerate(
+                    state["time_frame"], state["current_profile"], gathered_info
                 )
                 return {"future_profile": profile}
 
@@ -94,10 +105,20 @@ class SimulationWorkflow:
                 return "tools"
             return END
 
-        graph = StateGraph(SimState)
         tool_node = ToolNode(self.tools)
-        graph.add_node("agent", call_model)
-        graph.add_node("tools", tool_node)
+
+        # ノードごとの実行時間を記録する
+        async def agent(state: SimState):
+            with simulation_node_time.time(node="agent"):
+                return await call_model(state)
+
+        async def tools(state: SimState):
+            with simulation_node_time.time(node="tools"):
+                return await tool_node.ainvoke(state)
+
+        graph = StateGraph(SimState)
+        graph.add_node("agent", agent)
+        graph.add_node("tools", tools)
 
         graph.add_edge(START, "agent")
         graph.add_conditional_edges("agent", should_continue, ["tools", END])
@@ -105,15 +126,28 @@ class SimulationWorkflow:
         workflow = graph.compile()
         return workflow
 
-    def generate(self, time_frame: int = 10) -> FutureProfile:
-        self.time_frame = time_frame
+    async def agenerate(
+        self, current_profile: CurrentProfile, time_frame: int = 10
+    ) -> FutureProfile:
         future_prof = FutureProfile(
             status="", skills=[], time_frame=time_frame, summary=""
         )
         state = SimState(
-            {"messages": [HumanMessage(content="")], "future_profile": future_prof}
+            {
+                "messages": [HumanMessage(content="")],
+                "future_profile": future_prof,
+                "current_profile": current_profile,
+                "time_frame": time_frame,
+            }
+        )
+        result = await self.workflow.ainvoke(state)
+        simulation_tool_iterations.observe(
+            sum(
+                1
+                for msg in result["messages"]
+                if isinstance(msg, AIMessage) and msg.tool_calls
+            )
         )
-        result = self.workflow.invoke(state)
         return result["future_profile"]
 
 
@@ -121,27 +155,27 @@ class ChatWorkflow:
     """
     ChatVertexAIを用いたワークフロークラス。
     入力を受け取り、モデルに処理を委ね、ストリーム形式で結果を出力する。
+    プロフィールはステートで渡すため、1つのインスタンスを全ての会話で使い回せる。
     """
 
-    def __init__(
-        self,
-        model: ChatVertexAI,
-        current_profile: CurrentProfile,
-        future_profile: FutureProfile,
-    ):
+    def __init__(self, model: BaseChatModel):
         self.model = model
         self.chat_generator = ChatGenerator(self.model)
         self.workflow = self._build_workflow()
-        self.current_prof = current_profile
-        self.future_prof = future_profile
 
     def _build_workflow(self) -> CompiledStateGraph:
-        async def chat(state: ChatState):
+        async def chat(state: ChatState, config: RunnableConfig):
+            # process_state が中断された時にキャンセルできるよう、実行中のタスクを渡す
+            node_tasks = config.get("configurable", {}).get("node_tasks")
+            if node_tasks is not None:
+                node_tasks.add(asyncio.current_task())
             response = ""
             async for chunk in self.chat_generator.agenerate(state):
                 response += chunk
-            state.messages += [RoleMessage(role="agent", content=response)]
-            return state
+            return {
+                "messages": state.messages
+                + [RoleMessage(role="agent", content=response)]
+            }
 
         graph = StateGraph(ChatState)
         graph.add_node("agent", chat)
@@ -150,23 +184,47 @@ class ChatWorkflow:
         workflow = graph.compile()
         return workflow
 
-    async def process_input(self, history: list[RoleMessage], user_input: str):
+    async def process_input(
+        self,
+        current_profile: CurrentProfile,
+        future_profile: FutureProfile,
+        history: list[RoleMessage],
+        user_input: str,
+    ):
         input = history + [RoleMessage(role="user", content=user_input)]
         state: ChatState = ChatState(
             messages=input,
-            current_prof=self.current_prof,
-            future_prof=self.future_prof,
+            current_prof=current_profile,
+            future_prof=future_profile,
         )
-        async for msg, _ in self.workflow.astream(
-            state,
-            stream_mode="messages",
-        ):
-            if isinstance(msg, AIMessageChunk) and msg.content:
-                yield msg.content
+        async for chunk in self.process_state(state):
+            yield chunk
+
+    async def process_state(self, state: ChatState):
+        """
+        応答をストリーミングする。
+        途中で中断された場合（クライアントの切断など）は、グラフのノードを実行している
+        タスクもキャンセルする。LangGraph はノードを別のタスクで実行し、ストリームを
+        閉じても止めないため、そのままでは応答が最後まで生成されてしまう。
+        """
+        node_tasks: set[asyncio.Task] = set()
+        try:
+            async for msg, _ in self.workflow.astream(
+                state,
+                {"configurable": {"node_tasks": node_tasks}},
+                stream_mode="messages",
+            ):
+                if isinstance(msg, AIMessageChunk) and msg.content:
+                    yield msg.content
+        finally:
+            for task in node_tasks:
+                task.cancel()
 
 
 # 使用例
 async def main():
+    from langchain_google_vertexai import ChatVertexAI
+
     llm = ChatVertexAI(model="gemini-1.5-flash-002")
     user_data = CurrentProfile(
         age=20,
@@ -177,10 +235,10 @@ async def main():
         future_goals=["世界で活躍する"],
         extra="",
     )
-    sim_wf = SimulationWorkflow(llm, user_data)
-    future_avatar = sim_wf.generate(10)
+    sim_wf = SimulationWorkflow(llm)
+    future_avatar = await sim_wf.agenerate(user_data, 10)
     print(future_avatar)
-    chat_wf = ChatWorkflow(llm, user_data, future_avatar)
+    chat_wf = ChatWorkflow(llm)
 
     history = []
     while True:
@@ -190,7 +248,9 @@ async def main():
             break
         print("\n[Future Self]: ", end="")
         res = ""
-        async for chunk in chat_wf.process_input(history, user_input):
+        async for chunk in chat_wf.process_input(
+            user_data, future_avatar, history, user_input
+        ):
             print(chunk, end="", flush=True)
             res += str(chunk)
         history += [
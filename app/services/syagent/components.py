@@ -1,14 +1,46 @@
+import asyncio
+import time
 from typing import AsyncGenerator
 
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import AIMessage, AIMessageChunk
-from langchain_google_vertexai import ChatVertexAI
 
-from app.schemas.syagent import ChatState, CurrentProfile, FutureProfile
+from app.core.metrics import Counter, Histogram
+from app.schemas.syagent import ChatState, CurrentProfile, FutureProfile, RoleMessage
+from app.services.syagent.history import estimate_tokens
+
+# FutureSimulator・ProfileGenerator・CareerTool のプロンプトを変更したら上げる。
+# シミュレーションの応答キャッシュのキーに含まれる。
+SIMULATION_PROMPT_VERSION = "1"
+
+llm_time_to_first_token = Histogram(
+    "llm_time_to_first_token_seconds",
+    "LLM の呼び出しから最初のトークンを受け取るまでの時間",
+    ("component",),
+)
+llm_generation_time = Histogram(
+    "llm_generation_seconds", "LLM の応答の生成が終わるまでの時間", ("component",)
+)
+llm_tokens_per_second = Histogram(
+    "llm_tokens_per_second",
+    "最初のトークン以降の出力トークンの生成速度",
+    ("component",),
+    buckets=(5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500),
+)
+llm_cancelled = Counter(
+    "llm_cancelled_total", "生成の途中でキャンセルした LLM の呼び出し数", ("component",)
+)
+llm_tokens_saved = Counter(
+    "llm_tokens_saved_total",
+    "キャンセルにより生成せずに済んだ出力トークン数の見積もり"
+    "（完了した応答のトークン数の移動平均との差）",
+    ("component",),
+)
 
 
 class Interviewer:
-    def __init__(self, llm: ChatVertexAI):
+    def __init__(self, llm: BaseChatModel):
         self.llm = llm
         self.prompt = ChatPromptTemplate(
             [
@@ -29,13 +61,13 @@ class Interviewer:
                 ),
             ]
         )
+        self.chain = self.prompt | self.llm
 
     def generate_question(self, current_profile: CurrentProfile) -> str:
-        chain = self.prompt | self.llm
         input_data = {
             "current_profile": current_profile.to_str(),
         }
-        response: str = chain.invoke(input_data).content  # type:ignore
+        response: str = self.chain.invoke(input_data).content  # type:ignore
         return response
 
 
@@ -66,17 +98,28 @@ class FutureSimulator:
                 ),
             ]
         )
+        self.chain = self.prompt | self.llm
 
     def run(
         self, time_frame: int, current_prof: CurrentProfile, gathered_info: str
     ) -> AIMessage:
-        chain = self.prompt | self.llm
         input_data = {
             "time_frame": time_frame,
             "current_profile": current_prof.to_str(),
             "gathered_info": gathered_info,
         }
-        response = chain.invoke(input_data)
+        response = self.chain.invoke(input_data)
+        return response
+
+    async def arun(
+        self, time_frame: int, current_prof: CurrentProfile, gathered_info: str
+    ) -> AIMessage:
+        input_data = {
+            "time_frame": time_frame,
+            "current_profile": current_prof.to_str(),
+            "gathered_info": gathered_info,
+        }
+        response = await self.chain.ainvoke(input_data)
         return response
 
 
@@ -106,23 +149,37 @@ class ProfileGenerator:
                 ),
             ]
         )
+        self.chain = self.prompt | self.llm.with_structured_output(FutureProfile)
 
     def generate(
         self, time_frame: int, current_prof: CurrentProfile, gathered_info: str
     ) -> FutureProfile:
-        chain = self.prompt | self.llm.with_structured_output(FutureProfile)
         input_data = {
             "time_frame": time_frame,
             "current_profile": current_prof.to_str(),
             "gathered_info": gathered_info,
         }
-        response: FutureProfile = chain.invoke(input_data)
+        response: FutureProfile = self.chain.invoke(input_data)
+        return response
+
+    async def agenerate(
+        self, time_frame: int, current_prof: CurrentProfile, gathered_info: str
+    ) -> FutureProfile:
+        input_data = {
+            "time_frame": time_frame,
+            "current_profile": current_prof.to_str(),
+            "gathered_info": gathered_info,
+        }
+        response: FutureProfile = await self.chain.ainvoke(input_data)
         return response
 
 
 class ChatGenerator:
-    def __init__(self, llm: ChatVertexAI):
+    def __init__(self, llm: BaseChatModel):
         self.llm = llm
+        # 完了した応答の出力トークン数の指数移動平均。
+        # キャンセルした時に節約できたトークン数の見積もりに使う
+        self._expected_tokens: float | None = None
         self.prompt = ChatPromptTemplate(
             [
                 (
@@ -141,21 +198,94 @@ class ChatGenerator:
                 (
                     "human",
                     """
+                    これまでの会話の要約：{summary}
                     過去のメッセージ：{history}
                     ユーザの入力：{input}
                     """,
                 ),
             ]
         )
+        self.chain = self.prompt | self.llm
 
     async def agenerate(self, state: ChatState) -> AsyncGenerator[str, None]:
-        chain = self.prompt | self.llm
         formatted_data = {
-            "current_profile": state.current_prof.to_str(),
-            "future_profile": state.future_prof.to_str(),
+            "current_profile": state.current_prof_text or state.current_prof.to_str(),
+            "future_profile": state.future_prof_text or state.future_prof.to_str(),
+            "summary": state.summary,
             "history": state.messages[:-1],
             "input": state.messages[-1],
         }
-        async for chunk in chain.astream(formatted_data):
-            if isinstance(chunk, AIMessageChunk) and chunk.content:
-                yield str(chunk.content)
+        start = time.perf_counter()
+        first_token_at = None
+        response = ""
+        output_tokens = 0
+        try:
+            async for chunk in self.chain.astream(formatted_data):
+                if isinstance(chunk, AIMessageChunk) and chunk.usage_metadata:
+                    output_tokens += chunk.usage_metadata["output_tokens"]
+                if isinstance(chunk, AIMessageChunk) and chunk.content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        llm_time_to_first_token.observe(
+                            first_token_at - start, component="chat"
+                        )
+                    response += str(chunk.content)
+                    yield str(chunk.content)
+        except (asyncio.CancelledError, GeneratorExit):
+            # クライアントの切断などで中断した。chain.astream も閉じられ、生成が止まる
+            llm_cancelled.inc(component="chat")
+            if self._expected_tokens is not None:
+                generated = output_tokens or estimate_tokens(response)
+                saved = max(self._expected_tokens - generated, 0)
+                llm_tokens_saved.inc(saved, component="chat")
+            raise
+        elapsed = time.perf_counter() - start
+        llm_generation_time.observe(elapsed, component="chat")
+        # モデルがトークン数を返さない場合は概算する
+        tokens = output_tokens or estimate_tokens(response)
+        self._expected_tokens = (
+            tokens
+            if self._expected_tokens is None
+            else 0.9 * self._expected_tokens + 0.1 * tokens
+        )
+        if first_token_at is not None and elapsed > first_token_at - start:
+            llm_tokens_per_second.observe(
+                tokens / (elapsed - (first_token_at - start)), component="chat"
+            )
+
+
+class HistorySummarizer:
+    """
+    古い会話を、これまでの要約に追記する形で要約する。
+    """
+
+    def __init__(self, llm: BaseChatModel):
+        self.llm = llm
+        self.prompt = ChatPromptTemplate(
+            [
+                (
+                    "system",
+                    """
+                あなたはユーザと未来の自己像との会話を要約するアシスタントです。
+                これまでの要約に新しいメッセージの内容を反映し、更新した要約のみを出力してください。
+                ユーザが話した事実、悩み、決めたことを優先して残し、簡潔に記述してください。
+                """,
+                ),
+                (
+                    "human",
+                    """
+                これまでの要約：{summary}
+                新しいメッセージ：{messages}
+                """,
+                ),
+            ]
+        )
+        self.chain = self.prompt | self.llm
+
+    async def arun(self, summary: str, messages: list[RoleMessage]) -> str:
+        input_data = {
+            "summary": summary,
+            "messages": "\n".join(f"{m.role}: {m.content}" for m in messages),
+        }
+        response = await self.chain.ainvoke(input_data)
+        return str(response.content)
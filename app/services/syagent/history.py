@@ -0,0 +1,25 @@
+from app.schemas.syagent import RoleMessage
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数を概算する。
+    日本語は1文字あたり約1トークン、ASCII は約4文字あたり1トークンとして数える。
+    """
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def fit_to_budget(messages: list[RoleMessage], token_budget: int) -> list[RoleMessage]:
+    """
+    新しいメッセージから順に、トークン数の上限に収まる分だけを残す。
+    """
+    kept: list[RoleMessage] = []
+    total = 0
+    for message in reversed(messages):
+        total += estimate_tokens(message.content)
+        if total > token_budget:
+            break
+        kept.append(message)
+    kept.reverse()
+    return kept
@@ -1,9 +1,43 @@
-from vertexai.preview.vision_models import ImageGenerationModel
+import asyncio
+import struct
+import unicodedata
+import zlib
+from typing import Any
 
-generation_model = ImageGenerationModel.from_pretrained("imagen-3.0-generate-001")
+from app.core.config import setting
+from app.core.lazy import Lazy
+from app.core.metrics import Histogram
+from app.services.resilience import create_resilience
 
 
-def generate_icon(input: str) -> str:
+def _load_generation_model() -> Any:
+    # vertexai の import には数秒かかるため、モジュールの import 時には行わない
+    from vertexai.preview.vision_models import ImageGenerationModel
+
+    return ImageGenerationModel.from_pretrained("imagen-3.0-generate-001")
+
+
+# モデルの読み込みは起動時の warm_up か、最初に使われた時に行う
+generation_model = Lazy(_load_generation_model, name="imagen")
+
+# プロンプトを変更した場合は更新し、キャッシュ済みのアイコンを使わないようにする
+PROMPT_VERSION = "1"
+
+icon_generation_time = Histogram(
+    "icon_generation_seconds", "Imagen によるアイコン生成にかかった時間"
+)
+
+imagen_resilience = create_resilience("imagen", setting.icon_request_timeout_seconds)
+
+
+def normalize_summary(summary: str) -> str:
+    """
+    アイコンのキャッシュキーとして使うため、表記揺れを吸収する。
+    """
+    return " ".join(unicodedata.normalize("NFKC", summary).split()).lower()
+
+
+def generate_icon(input: str) -> bytes:
     prompt = f"""
     {input}というキーワードに基づいて、可愛い動物のアイコンを生成してください。
     動物のみを描き、背景は白にしてください。
@@ -12,8 +46,42 @@ def generate_icon(input: str) -> str:
     その特徴を生かして、動物のアイコンを生成してください。
     繰り返しますが、人間の要素は一切含めず、純粋な動物の姿で表現してください。
     """
-    response = generation_model.generate_images(
+    response = generation_model.get().generate_images(
         prompt=prompt,
         language="ja",
     )
-    return response.images[0]._as_base64_string()
+    return response.images[0]._image_bytes
+
+
+async def agenerate_icon(input: str) -> bytes:
+    """
+    Imagen の SDK は同期 API のみのため、
+    スレッドプールで実行してイベントループを塞がないようにする。
+    SDK に期限を渡せず、タイムアウトしてもスレッドの呼び出しは続くため、
+    タイムアウトした場合はリトライしない。
+    """
+    with icon_generation_time.time():
+        return await imagen_resilience.call(
+            lambda: asyncio.to_thread(generate_icon, input), retry_timeouts=False
+        )
+
+
+def placeholder_icon(size: int = 64) -> bytes:
+    """
+    Imagen を利用できない場合に代わりに返す、薄い灰色の無地の PNG 画像。
+    """
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    # 各行の先頭にフィルタの種類（0: なし）を置く
+    rows = (b"\x00" + b"\xe0\xe0\xe0" * size) * size
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)),
+            chunk(b"IDAT", zlib.compress(rows)),
+            chunk(b"IEND", b""),
+        ]
+    )
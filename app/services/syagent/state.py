@@ -3,9 +3,12 @@ from typing import Annotated
 from langgraph.graph.message import add_messages
 from typing_extensions import TypedDict
 
-from app.schemas.syagent import FutureProfile
+from app.schemas.syagent import CurrentProfile, FutureProfile
 
 
 class SimState(TypedDict):
     messages: Annotated[list, add_messages]
     future_profile: FutureProfile
+    # リクエストごとの入力。コンパイル済みのグラフを使い回すため、ステートで渡す
+    current_profile: CurrentProfile
+    time_frame: int
@@ -1,9 +1,9 @@
 from langchain.prompts import ChatPromptTemplate
-from langchain_google_vertexai import ChatVertexAI
+from langchain_core.language_models import BaseChatModel
 
 
 class RequiredSkillsTool:
-    def __init__(self, llm: ChatVertexAI):
+    def __init__(self, llm: BaseChatModel):
         self.llm = llm
         self.prompt = ChatPromptTemplate(
             [
@@ -29,7 +29,7 @@ class RequiredSkillsTool:
 
 
 class CareerTool:
-    def __init__(self, llm: ChatVertexAI):
+    def __init__(self, llm: BaseChatModel):
         self.llm = llm
         self.prompt = ChatPromptTemplate(
             [
@@ -54,7 +54,7 @@ class CareerTool:
 
 
 class PotentialTool:
-    def __init__(self, llm: ChatVertexAI):
+    def __init__(self, llm: BaseChatModel):
         self.llm = llm
         self.prompt = ChatPromptTemplate(
             [
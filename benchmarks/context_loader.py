@@ -0,0 +1,151 @@
+"""
+create_message が会話の情報を取得する際のクエリ数と所要時間を比較する。
+
+    uv run python -m benchmarks.context_loader --rtt-ms 1
+
+--url を省略した場合はインメモリの SQLite を使う。
+"""
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from app.crud.context import load_conversation_context, profiles_cache
+from app.models import syagent as syagent_model
+from benchmarks.db import StatementCounter, create_engine
+
+
+async def seed(db: AsyncSession, skills: int, messages: int) -> int:
+    current_profile = syagent_model.CurrentProfile(
+        user_id="bench",
+        age=20,
+        status="学生",
+        values="健康第一",
+        restrictions="なし",
+        extra="",
+        current_skills=[
+            syagent_model.CurrentSkill(skill=f"skill-{i}") for i in range(skills)
+        ],
+        future_goals=[syagent_model.FutureGoal(goal=f"goal-{i}") for i in range(3)],
+    )
+    future_profile = syagent_model.FutureProfile(
+        user_id="bench",
+        current_profile=current_profile,
+        status="研究者",
+        time_frame=10,
+        summary="データサイエンティスト",
+        future_skills=[
+            syagent_model.FutureSkill(skill=f"future-skill-{i}") for i in range(skills)
+        ],
+    )
+    conversation = syagent_model.Conversation(
+        user_id="bench",
+        future_profile=future_profile,
+        title=future_profile.summary,
+        icon_hash="0" * 64,
+        messages=[
+            syagent_model.Message(
+                role="user" if i % 2 == 0 else "agent", message=f"message-{i}"
+            )
+            for i in range(messages)
+        ],
+    )
+    db.add(conversation)
+    await db.commit()
+    return conversation.id
+
+
+async def load_sequential(db: AsyncSession, conversation_id: int) -> None:
+    """
+    従来の create_message と同じく、テーブルごとに SELECT を発行する。
+    """
+    conversation = (
+        await db.execute(
+            select(syagent_model.Conversation).filter_by(id=conversation_id)
+        )
+    ).scalar_one()
+    (
+        await db.execute(
+            select(syagent_model.Message).filter_by(conversation_id=conversation_id)
+        )
+    ).scalars().all()
+    future_profile = (
+        await db.execute(
+            select(syagent_model.FutureProfile).filter_by(
+                id=conversation.future_profile_id
+            )
+        )
+    ).scalar_one()
+    (
+        await db.execute(
+            select(syagent_model.FutureSkill).filter_by(
+                future_profile_id=future_profile.id
+            )
+        )
+    ).scalars().all()
+    current_profile = (
+        await db.execute(
+            select(syagent_model.CurrentProfile).filter_by(
+                id=future_profile.current_profile_id
+            )
+        )
+    ).scalar_one()
+    (
+        await db.execute(
+            select(syagent_model.CurrentSkill).filter_by(
+                current_profile_id=current_profile.id
+            )
+        )
+    ).scalars().all()
+    (
+        await db.execute(
+            select(syagent_model.FutureGoal).filter_by(
+                current_profile_id=current_profile.id
+            )
+        )
+    ).scalars().all()
+
+
+async def load_uncached(db: AsyncSession, conversation_id: int) -> None:
+    profiles_cache.clear()
+    await load_conversation_context(db, conversation_id)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite+aiosqlite:///:memory:")
+    parser.add_argument("--rtt-ms", type=float, default=1.0)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--skills", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=40)
+    args = parser.parse_args()
+
+    engine = await create_engine(args.url)
+    session = async_sessionmaker(engine, expire_on_commit=False)
+    async with session() as db:
+        conversation_id = await seed(db, args.skills, args.messages)
+    counter = StatementCounter(engine, args.rtt_ms)
+
+    for name, load in [
+        ("sequential", load_sequential),
+        ("context_loader", load_uncached),
+        ("cached", load_conversation_context),
+    ]:
+        counter.reset()
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            async with session() as db:
+                await load(db, conversation_id)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>16}: {counter.count / args.iterations:.1f} statements/turn, "
+            f"{elapsed / args.iterations * 1000:.2f} ms/turn"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
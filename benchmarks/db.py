@@ -0,0 +1,45 @@
+import time
+
+from sqlalchemy import BigInteger, event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+
+from app.models import Base
+
+
+@compiles(BigInteger, "sqlite")
+def _compile_big_integer_sqlite(type_, compiler, **kw):
+    # SQLite は INTEGER PRIMARY KEY のみ自動採番するため
+    return "INTEGER"
+
+
+class StatementCounter:
+    """
+    エンジンが発行した SQL 文を数える。
+    rtt_ms を指定すると、1文ごとにネットワークの往復遅延を模擬する。
+    """
+
+    def __init__(self, engine: AsyncEngine, rtt_ms: float = 0.0):
+        self.count = 0
+        self.rtt = rtt_ms / 1000
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs) -> None:
+        self.count += 1
+        if self.rtt:
+            # ベンチマークは逐次実行のため、ブロッキングの sleep で十分
+            time.sleep(self.rtt)
+
+    def reset(self) -> None:
+        self.count = 0
+
+
+async def create_engine(url: str) -> AsyncEngine:
+    """
+    ベンチマーク用のエンジンを作成する。SQLite の場合はテーブルも作成する。
+    """
+    engine = create_async_engine(url)
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    return engine
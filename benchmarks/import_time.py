@@ -0,0 +1,113 @@
+"""
+`python -X importtime` でアプリケーションの import にかかる時間を計測する。
+別のプロセスで --runs 回 import し、合計時間の中央値と、累積時間の長いモジュールの
+上位 --top 件を表示する。環境変数（.env）は実行時と同じものが必要。
+
+    uv run python -m benchmarks.import_time --runs 5
+
+--baseline に以前の結果を指定すると、合計時間が --tolerance 以上悪化した場合や、
+ベースラインになかった重いモジュールが上位に現れた場合に表示して終了コード 1 を返す。
+--update-baseline を付けると、今回の結果で上書きする。
+"""
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+DEFAULT_BASELINE = Path(__file__).with_name("import_time_baseline.json")
+
+# import time:  self [us] | cumulative | imported package
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def measure(module: str) -> dict[str, int]:
+    """
+    module を新しいプロセスで import し、モジュールごとの累積時間（マイクロ秒）を返す。
+    同じモジュールが複数回現れることはない（2回目以降はキャッシュされる）。
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            cumulative[match[4]] = int(match[2])
+    return cumulative
+
+
+def by_package(cumulative: dict[str, int]) -> dict[str, int]:
+    """
+    最上位のパッケージ名ごとに、そのパッケージのモジュールの最大の累積時間をとる。
+    """
+    packages: dict[str, int] = {}
+    for name, us in cumulative.items():
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0), us)
+    return packages
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # 1回目は .pyc の生成を含むため捨てる
+    measure(args.module)
+    runs = [measure(args.module) for _ in range(args.runs)]
+    total_ms = statistics.median(run[args.module] for run in runs) / 1000
+    # 計測対象のパッケージ自身は全体と同じになるため除く
+    own = args.module.split(".")[0]
+    per_run = [by_package(run) for run in runs]
+    medians = {
+        package: statistics.median(run.get(package, 0) for run in per_run) / 1000
+        for package in per_run[0]
+        if package != own
+    }
+    ordered = sorted(medians.items(), key=lambda item: item[1], reverse=True)
+    packages = dict(ordered[: args.top])
+
+    print(f"{args.module}: {total_ms:.1f} ms (median of {args.runs})")
+    for package, ms in packages.items():
+        print(f"{package:>40} {ms:>8.1f} ms")
+
+    if args.update_baseline:
+        args.baseline.write_text(
+            json.dumps(
+                {"module": args.module, "total_ms": total_ms, "packages": packages},
+                indent=2,
+            )
+            + "\n"
+        )
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    regressions = []
+    if total_ms > baseline["total_ms"] * (1 + args.tolerance):
+        regressions.append(f"total: {baseline['total_ms']:.1f} -> {total_ms:.1f} ms")
+    # 上位の境界付近での入れ替わりは無視する
+    threshold = min(baseline["packages"].values(), default=0) * (1 + args.tolerance)
+    for package, ms in packages.items():
+        if package not in baseline["packages"] and ms > threshold:
+            regressions.append(f"new heavy import: {package} ({ms:.1f} ms)")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
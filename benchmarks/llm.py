@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+
+# キャリア設計の応答に含め、情報収集の回数を数えるのに使う
+CAREER_PATH = "[career-path]"
+
+
+class FakeChatModel(GenericFakeChatModel):
+    """
+    決まった応答を順に返すチャットモデル。ツール呼び出しの応答も返せる。
+    bind_tools / with_structured_output はモデル自身をそのまま使う。
+    first_token_delay と tokens_per_second を指定すると、実際のモデルの
+    応答速度を模擬する（トークンは空白で区切った単位）。
+    """
+
+    first_token_delay: float = 0.0
+    tokens_per_second: float | None = None
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        return self
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        result = self._generate(messages, stop=stop, **kwargs)
+        message = result.generations[0].message
+        await asyncio.sleep(
+            self.first_token_delay
+            + self._token_interval * _count_tokens(message.content, message)
+        )
+        return result
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        delay = self.first_token_delay
+        for chunk in self._stream(messages, stop=stop, **kwargs):
+            await asyncio.sleep(delay)
+            delay = self._token_interval
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    @property
+    def _token_interval(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+
+def _count_tokens(content: Any, message: BaseMessage) -> int:
+    tool_calls = getattr(message, "tool_calls", None) or []
+    return len(str(content).split()) + sum(len(str(c["args"])) // 4 for c in tool_calls)
+
+
+@dataclass
+class _GeneratedImage:
+    _image_bytes: bytes
+
+
+@dataclass
+class _ImageGenerationResponse:
+    images: list[_GeneratedImage]
+
+
+class FakeImageModel:
+    """
+    Imagen の ImageGenerationModel の代わりに、プロンプトから決まる画像を返す。
+    generate_images はスレッドプールで呼ばれるため、待ち時間はブロッキングで模擬する。
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def generate_images(self, prompt: str, **kwargs: Any) -> _ImageGenerationResponse:
+        if self.delay:
+            time.sleep(self.delay)
+        image = b"\x89PNG\r\n\x1a\n" + hashlib.sha256(prompt.encode()).digest()
+        return _ImageGenerationResponse(images=[_GeneratedImage(image)])
+
+
+def simulation_messages() -> Iterator[AIMessage]:
+    """
+    SimulationWorkflow を1回実行する際の応答（ツール呼び出し、キャリア設計、
+    情報収集完了、プロフィール生成）を繰り返し返す。
+    """
+    return itertools.cycle(
+        [
+            _design_career_call(),
+            AIMessage(content="大学院で研究を行い、海外の企業に就職する"),
+            AIMessage(content="情報収集完了"),
+            _future_profile_call(),
+        ]
+    )
+
+
+class SimulationChatModel(FakeChatModel):
+    """
+    SimulationWorkflow 用に、呼び出し元に応じた応答を返すチャットモデル。
+    応答を順番に返す FakeChatModel と違い、複数のシミュレーションを並行して
+    実行しても応答が入れ替わらない。
+    実際のモデルと同じく bind_tools はツールを呼び出し時の引数として束縛するため、
+    他のモデルに包まれていても、渡されたツールから呼び出し元を判断できる。
+    情報収集では tool_iterations 回だけキャリア設計のツールを呼ぶ。
+    """
+
+    messages: Iterator[AIMessage | str] = iter([])
+    tool_iterations: int = 1
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        names = [getattr(t, "name", None) or t.__name__ for t in tools]
+        return self.bind(tool_names=names, **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tool_names = kwargs.get("tool_names", [])
+        if "FutureProfile" in tool_names:
+            message = _future_profile_call()
+        elif "design_career" in tool_names:
+            prompt = "".join(str(m.content) for m in messages)
+            if prompt.count(CAREER_PATH) < self.tool_iterations:
+                message = _design_career_call()
+            else:
+                message = AIMessage(content="情報収集完了")
+        else:
+            message = AIMessage(content=f"{CAREER_PATH} 大学院で研究を行い 就職する")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class ServiceChatModel(SimulationChatModel):
+    """
+    LLM プロバイダが生成するモデルの代わりに、チャットとシミュレーションの両方に
+    応答する。チャットの応答はストリーミングで生成されるため、ストリーミングでは
+    chat_messages の応答を、それ以外では SimulationChatModel の応答を返す。
+    """
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        chat = FakeChatModel(
+            messages=chat_messages(),
+            first_token_delay=self.first_token_delay,
+            tokens_per_second=self.tokens_per_second,
+        )
+        async for chunk in chat._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+
+def _design_career_call() -> AIMessage:
+    return AIMessage(
+        content="",
+        tool_calls=[
+            {
+                "name": "design_career",
+                "args": {
+                    "time_frame": 10,
+                    "current_age": 20,
+                    "current_status": "学生",
+                    "current_skills": ["英語"],
+                    "values": "健康第一",
+                    "restrictions": "なし",
+                    "future_goals": ["世界で活躍する"],
+                },
+                "id": "design_career",
+            }
+        ],
+    )
+
+
+def _future_profile_call() -> AIMessage:
+    return AIMessage(
+        content="",
+        tool_calls=[
+            {
+                "name": "FutureProfile",
+                "args": {
+                    "status": "研究者",
+                    "skills": ["機械学習"],
+                    "time_frame": 10,
+                    "summary": "データサイエンティスト",
+                },
+                "id": "future_profile",
+            }
+        ],
+    )
+
+
+def chat_messages() -> Iterator[AIMessage]:
+    return itertools.cycle([AIMessage(content="10年後の私も 元気に 過ごしています")])
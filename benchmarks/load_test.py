@@ -0,0 +1,354 @@
+"""
+偽物のチャットモデルと画像生成モデルに差し替えたサーバを起動し、会話の作成・一覧・
+メッセージの送信・メッセージの一覧・会話の削除の5つのエンドポイントに並行して
+リクエストを送る。エンドポイントごとにレイテンシ（p50/p95/p99）、最初のバイトが
+届くまでの時間（TTFB）とスループットを表示する。Vertex AI には接続しない。
+
+    uv run python -m benchmarks.load_test --concurrency 8 --requests 100
+
+--url を省略した場合は一時ディレクトリの SQLite を使う。PostgreSQL の場合は
+マイグレーション済みのデータベースを指定する。生成したアイコンも一時ディレクトリに保存する。
+--baseline（省略時は既定の引数で記録した load_test_baseline.json）と比べ、
+--tolerance の割合以上かつ --min-delta-ms 以上悪化したエンドポイントを表示して
+終了コード 1 を返す。--update-baseline を付けると、今回の結果で上書きする。
+レイテンシは実行するマシンに依存するため、比べる前に同じマシンで記録し直す。
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api.api import api_router
+from app.core.config import setting
+from app.crud import llm_cache as llm_cache_crud
+from app.crud import syagent as syagent_crud
+from app.services.storage import get_icon_store
+from app.services.syagent import image
+from benchmarks.db import create_engine
+from benchmarks.llm import FakeImageModel, ServiceChatModel
+from benchmarks.workflow_setup import CURRENT_PROFILE
+
+DEFAULT_BASELINE = Path(__file__).with_name("load_test_baseline.json")
+
+
+@dataclass
+class Result:
+    endpoint: str
+    latencies: list[float] = field(default_factory=list)
+    ttfbs: list[float] = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "requests": len(self.latencies) + self.errors,
+            "errors": self.errors,
+            "p50_ms": percentile(self.latencies, 50) * 1000,
+            "p95_ms": percentile(self.latencies, 95) * 1000,
+            "p99_ms": percentile(self.latencies, 99) * 1000,
+            "ttfb_p50_ms": percentile(self.ttfbs, 50) * 1000,
+            "ttfb_p95_ms": percentile(self.ttfbs, 95) * 1000,
+            "rps": len(self.latencies) / self.elapsed if self.elapsed else 0.0,
+        }
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+async def request(
+    client: httpx.AsyncClient, result: Result, method: str, url: str, **kwargs: Any
+) -> bytes | None:
+    """
+    リクエストを送り、TTFB とレスポンスの受信完了までの時間を記録する。
+    エラーのレスポンスの場合は None を返す。
+    """
+    start = time.perf_counter()
+    ttfb = None
+    body = b""
+    async with client.stream(method, url, **kwargs) as response:
+        async for chunk in response.aiter_raw():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            body += chunk
+    if response.is_error:
+        result.errors += 1
+        return None
+    result.latencies.append(time.perf_counter() - start)
+    result.ttfbs.append(ttfb if ttfb is not None else result.latencies[-1])
+    return body
+
+
+async def run_scenario(
+    endpoint: str,
+    requests: int,
+    concurrency: int,
+    send: Callable[[Result, int], Awaitable[None]],
+) -> Result:
+    """
+    concurrency 個のワーカーで、合計 requests 回 send を呼び出す。
+    """
+    result = Result(endpoint)
+    indexes = iter(range(requests))
+
+    async def worker() -> None:
+        for i in indexes:
+            try:
+                await send(result, i)
+            except httpx.HTTPError:
+                result.errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def run_load_test(
+    client: httpx.AsyncClient, requests: int, concurrency: int
+) -> list[Result]:
+    # 前回の実行で作られた会話と混ざらないよう、実行ごとに別のユーザを使う
+    user_id = f"load-test-{uuid.uuid4().hex[:8]}"
+    conversation_ids: list[int] = []
+
+    async def create_conversation(result: Result, i: int) -> None:
+        body = await request(
+            client,
+            result,
+            "POST",
+            f"/api/agents/{user_id}",
+            json=CURRENT_PROFILE.model_dump(),
+        )
+        if body is not None:
+            conversation_ids.append(json.loads(body)["id"])
+
+    async def read_conversations(result: Result, i: int) -> None:
+        await request(client, result, "GET", f"/api/agents/{user_id}")
+
+    async def create_message(result: Result, i: int) -> None:
+        conversation_id = conversation_ids[i % len(conversation_ids)]
+        await request(
+            client,
+            result,
+            "POST",
+            f"/api/agents/conversations/{conversation_id}",
+            json={"message": "10年後の私は元気ですか？"},
+        )
+
+    async def read_messages(result: Result, i: int) -> None:
+        conversation_id = conversation_ids[i % len(conversation_ids)]
+        await request(
+            client, result, "GET", f"/api/agents/conversations/{conversation_id}"
+        )
+
+    async def delete_conversation(result: Result, i: int) -> None:
+        conversation_id = conversation_ids[i]
+        await request(
+            client, result, "DELETE", f"/api/agents/conversations/{conversation_id}"
+        )
+
+    results = [
+        await run_scenario(
+            "create_conversation", requests, concurrency, create_conversation
+        )
+    ]
+    if not conversation_ids:
+        return results
+    for endpoint, send, count in [
+        ("read_conversations", read_conversations, requests),
+        ("create_message", create_message, requests),
+        ("read_messages", read_messages, requests),
+        ("delete_conversation", delete_conversation, len(conversation_ids)),
+    ]:
+        results.append(await run_scenario(endpoint, count, concurrency, send))
+    return results
+
+
+def print_results(results: list[Result]) -> None:
+    header = (
+        f"{'endpoint':>20} {'n':>5} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8}"
+        f" {'ttfb50':>8} {'ttfb95':>8} {'req/s':>8}"
+    )
+    print(header)
+    for result in results:
+        s = result.summary()
+        print(
+            f"{result.endpoint:>20} {s['requests']:>5} {s['errors']:>4}"
+            f" {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}"
+            f" {s['ttfb_p50_ms']:>8.1f} {s['ttfb_p95_ms']:>8.1f} {s['rps']:>8.1f}"
+        )
+    print("(latency in ms)")
+
+
+def compare_baseline(
+    results: list[Result],
+    baseline: dict,
+    params: dict,
+    tolerance: float,
+    min_delta_ms: float,
+) -> list[str]:
+    """
+    ベースラインより tolerance の割合以上、かつ min_delta_ms 以上悪化した指標を返す。
+    レイテンシの短いエンドポイントの揺らぎを誤検知しないよう、差が小さいものは無視する。
+    スループットは、ワーカーあたりの1リクエストの時間（並行数 / rps）に換算して比べる。
+    """
+    if baseline.get("params") != params:
+        print("warning: baseline was recorded with different parameters")
+
+    def per_request_ms(rps: float) -> float:
+        return params["concurrency"] * 1000 / rps if rps else math.inf
+
+    regressions = []
+    for result in results:
+        base = baseline.get("endpoints", {}).get(result.endpoint)
+        if base is None:
+            continue
+        current = result.summary()
+        for metric in ("p95_ms", "p99_ms", "ttfb_p95_ms"):
+            if (
+                current[metric] > base[metric] * (1 + tolerance)
+                and current[metric] - base[metric] >= min_delta_ms
+            ):
+                regressions.append(
+                    f"{result.endpoint} {metric}: "
+                    f"{base[metric]:.1f} -> {current[metric]:.1f}"
+                )
+        if (
+            current["rps"] < base["rps"] * (1 - tolerance)
+            and per_request_ms(current["rps"]) - per_request_ms(base["rps"])
+            >= min_delta_ms
+        ):
+            regressions.append(
+                f"{result.endpoint} rps: {base['rps']:.1f} -> {current['rps']:.1f}"
+            )
+        if current["errors"] > base["errors"]:
+            regressions.append(
+                f"{result.endpoint} errors: {base['errors']} -> {current['errors']}"
+            )
+    return regressions
+
+
+def install_fakes(args: argparse.Namespace) -> None:
+    """
+    Vertex AI のクライアントが生成される前に、LLM プロバイダが生成するモデルと
+    Imagen のモデルを偽物に差し替える。プロバイダが包むモデル（Resilience、ヘッジ）と
+    シミュレーションのキャッシュは、本番と同じく適用される。
+    """
+    fake = ServiceChatModel(
+        tool_iterations=args.tool_iterations,
+        first_token_delay=args.first_token_delay,
+        tokens_per_second=args.tokens_per_second,
+    )
+    syagent_crud.llm_provider._create = lambda model: fake
+    image.generation_model.override(FakeImageModel(delay=args.icon_delay))
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="SQLAlchemy の接続先（省略時は SQLite）")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--tool-iterations", type=int, default=1)
+    parser.add_argument("--icon-delay", type=float, default=2.0)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-delta-ms", type=float, default=25.0)
+    args = parser.parse_args()
+
+    install_fakes(args)
+    workdir = tempfile.mkdtemp()
+    # リポジトリの data/ にアイコンや LLM のキャッシュを書き込まないようにする
+    setting.icon_store_path = f"{workdir}/icons"
+    setting.llm_cache_path = f"{workdir}/llm_cache.sqlite3"
+    get_icon_store.cache_clear()
+    url = args.url or f"sqlite+aiosqlite:///{workdir}/load_test.sqlite3"
+    engine = await create_engine(url)
+    app = FastAPI()
+    app.include_router(api_router, prefix="/api")
+    app.state.db_session = async_sessionmaker(engine, expire_on_commit=False)
+    app.state.db_read_sessions = [app.state.db_session]
+    # lifespan を実行しないため、起動時と同じくシミュレーションのキャッシュを設定する
+    syagent_crud.simulation_cache.store = llm_cache_crud.create_llm_cache_store(
+        app.state.db_session
+    )
+
+    # 実際の HTTP を経由させ、ストリーミングの TTFB を計測できるようにする
+    server = uvicorn.Server(
+        uvicorn.Config(app, port=0, log_level="warning", lifespan="off")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}",
+            timeout=None,
+            limits=httpx.Limits(max_connections=args.concurrency),
+        ) as client:
+            results = await run_load_test(client, args.requests, args.concurrency)
+    finally:
+        server.should_exit = True
+        await serving
+        await engine.dispose()
+
+    print_results(results)
+    params = {
+        key: getattr(args, key)
+        for key in (
+            "requests",
+            "concurrency",
+            "first_token_delay",
+            "tokens_per_second",
+            "tool_iterations",
+            "icon_delay",
+        )
+    }
+    if args.update_baseline:
+        args.baseline.write_text(
+            json.dumps(
+                {
+                    "params": params,
+                    "endpoints": {r.endpoint: r.summary() for r in results},
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        return 0
+    regressions = compare_baseline(
+        results,
+        json.loads(args.baseline.read_text()),
+        params,
+        args.tolerance,
+        args.min_delta_ms,
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,88 @@
+"""
+ワークフローをリクエストごとに構築する場合と、一度だけ構築して使い回す場合で、
+1リクエストあたりの準備時間と実行時間を比較する。
+モデルは決まった応答を返す偽物を使うため、LLM の待ち時間は含まない。
+
+    uv run python -m benchmarks.workflow_setup
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from app.schemas.syagent import ChatState, CurrentProfile, RoleMessage
+from app.services.syagent.agents import ChatWorkflow, SimulationWorkflow
+from benchmarks.llm import FakeChatModel, chat_messages, simulation_messages
+
+CURRENT_PROFILE = CurrentProfile(
+    age=20,
+    status="学生",
+    skills=["英語が流暢に話せる", "サッカー"],
+    values="健康第一",
+    restrictions="親の面倒を見る必要がある",
+    future_goals=["世界で活躍する"],
+    extra="",
+)
+
+
+async def measure(
+    name: str, iterations: int, run: Callable[[], Awaitable[None]]
+) -> None:
+    await run()  # 初回のみ発生するコストを除く
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await run()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>24}: {elapsed / iterations * 1000:.3f} ms/request")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    sim_model = FakeChatModel(messages=simulation_messages())
+    chat_model = FakeChatModel(messages=chat_messages())
+    sim_workflow = SimulationWorkflow(sim_model)
+    chat_workflow = ChatWorkflow(chat_model)
+    future_profile = await sim_workflow.agenerate(CURRENT_PROFILE)
+    state = ChatState(
+        messages=[RoleMessage(role="user", content="元気ですか？")],
+        current_prof=CURRENT_PROFILE,
+        future_prof=future_profile,
+    )
+
+    async def build_simulation() -> None:
+        SimulationWorkflow(sim_model)
+
+    async def build_chat() -> None:
+        ChatWorkflow(chat_model)
+
+    async def simulate_per_request() -> None:
+        await SimulationWorkflow(sim_model).agenerate(CURRENT_PROFILE)
+
+    async def simulate_shared() -> None:
+        await sim_workflow.agenerate(CURRENT_PROFILE)
+
+    async def chat_per_request() -> None:
+        async for _ in ChatWorkflow(chat_model).process_state(state):
+            pass
+
+    async def chat_shared() -> None:
+        async for _ in chat_workflow.process_state(state):
+            pass
+
+    for name, run in [
+        ("simulation setup", build_simulation),
+        ("simulation per-request", simulate_per_request),
+        ("simulation shared", simulate_shared),
+        ("chat setup", build_chat),
+        ("chat per-request", chat_per_request),
+        ("chat shared", chat_shared),
+    ]:
+        await measure(name, args.iterations, run)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
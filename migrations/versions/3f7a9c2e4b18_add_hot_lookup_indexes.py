@@ -0,0 +1,73 @@
+"""add hot lookup indexes
+
+Revision ID: 3f7a9c2e4b18
+Revises: d81a5c37e2f9
+Create Date: 2026-10-18 15:02:11.418903
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f7a9c2e4b18"
+down_revision: Union[str, None] = "d81a5c37e2f9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (インデックス名, テーブル名, カラム)
+INDEXES = [
+    (
+        "ix_conversations_user_id_created_at_id",
+        "conversations",
+        ["user_id", "created_at", "id"],
+    ),
+    (
+        "ix_messages_conversation_id_created_at_id",
+        "messages",
+        ["conversation_id", "created_at", "id"],
+    ),
+    (
+        "ix_current_skills_current_profile_id",
+        "current_skills",
+        ["current_profile_id"],
+    ),
+    (
+        "ix_future_skills_future_profile_id",
+        "future_skills",
+        ["future_profile_id"],
+    ),
+    (
+        "ix_future_goals_current_profile_id",
+        "future_goals",
+        ["current_profile_id"],
+    ),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY はトランザクション内で実行できないため、
+    # autocommit で実行する。途中で失敗すると INVALID なインデックスが残り、
+    # if_not_exists では作り直されないので、再実行前に DROP INDEX すること。
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
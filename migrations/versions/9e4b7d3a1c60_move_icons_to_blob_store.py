@@ -0,0 +1,80 @@
+"""move icons to blob store
+
+Revision ID: 9e4b7d3a1c60
+Revises: 5c1f8a2d9b47
+Create Date: 2026-10-18 11:03:18.902451
+
+"""
+
+import asyncio
+import base64
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.services.storage import get_icon_store
+
+# revision identifiers, used by Alembic.
+revision: str = "9e4b7d3a1c60"
+down_revision: Union[str, None] = "5c1f8a2d9b47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+conversations = sa.table(
+    "conversations",
+    sa.column("id", sa.BigInteger()),
+    sa.column("icon", sa.String()),
+    sa.column("icon_hash", sa.String()),
+)
+
+BATCH_SIZE = 100
+
+
+def upgrade() -> None:
+    op.add_column(
+        "conversations", sa.Column("icon_hash", sa.String(length=64), nullable=True)
+    )
+
+    # 既存の base64 アイコンをストアへ移し、ハッシュ値で置き換える
+    store = get_icon_store()
+    connection = op.get_bind()
+    while True:
+        rows = connection.execute(
+            sa.select(conversations.c.id, conversations.c.icon)
+            .where(conversations.c.icon_hash.is_(None))
+            .order_by(conversations.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for id, icon in rows:
+            icon_hash = asyncio.run(store.put(base64.b64decode(icon)))
+            connection.execute(
+                conversations.update()
+                .where(conversations.c.id == id)
+                .values(icon_hash=icon_hash)
+            )
+
+    op.alter_column("conversations", "icon_hash", nullable=False)
+    op.drop_column("conversations", "icon")
+
+
+def downgrade() -> None:
+    op.add_column("conversations", sa.Column("icon", sa.String(), nullable=True))
+
+    store = get_icon_store()
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(conversations.c.id, conversations.c.icon_hash)
+    ).all()
+    for id, icon_hash in rows:
+        data = asyncio.run(store.get(icon_hash)) or b""
+        connection.execute(
+            conversations.update()
+            .where(conversations.c.id == id)
+            .values(icon=base64.b64encode(data).decode())
+        )
+
+    op.alter_column("conversations", "icon", nullable=False)
+    op.drop_column("conversations", "icon_hash")